@@ -8,6 +8,7 @@ import {
   saveRating,
   addNote,
   RecipeDetail,
+  Note,
   deleteNote,
   deleteRecipe
 } from "@/lib/api";
@@ -22,7 +23,7 @@ export default function RecipeDetailPage() {
   const [error, setError] = useState<string | null>(null);
   const [rating, setRating] = useState<number>(0);
   const [noteText, setNoteText] = useState("");
-  const [notes, setNotes] = useState<string[]>([]);
+  const [notes, setNotes] = useState<Note[]>([]);
   const router = useRouter();
 
   useEffect(() => {
@@ -37,7 +38,7 @@ export default function RecipeDetailPage() {
         const data = await fetchRecipeById(recipeId);
         setRecipe(data);
         setRating(data.userRating || 0);
-        setNotes(data.userNotes || []);
+        setNotes(data.notes || []);
       } catch (err) {
         setError("Failed to load recipe");
         console.error(err);
@@ -78,8 +79,8 @@ export default function RecipeDetailPage() {
 
   const handleAddNote = async () => {
     if (!noteText.trim()) return;
-    await addNote(recipe.id, noteText);
-    setNotes([...notes, noteText]);
+    const { id } = await addNote(recipe.id, noteText);
+    setNotes([...notes, { id, note: noteText, createdAt: new Date().toISOString() }]);
     setNoteText("");
   };
 
@@ -139,17 +140,17 @@ export default function RecipeDetailPage() {
           Add Note
         </button>
         <div className="space-y-1">
-        {notes.map((n, i) => (
+        {notes.map((n) => (
             <div
-            key={i}
+            key={n.id}
             className="flex items-center justify-between bg-white p-2 rounded border"
             >
-            <span>{n}</span>
+            <span>{n.note}</span>
             <button
                 className="text-red-500 hover:text-red-700 ml-4"
                 onClick={async () => {
-                await deleteNote(recipe.id, i);
-                setNotes((prev) => prev.filter((_, idx) => idx !== i));
+                await deleteNote(recipe.id, n.id);
+                setNotes((prev) => prev.filter((other) => other.id !== n.id));
                 }}
             >
                 Delete
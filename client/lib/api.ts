@@ -1,10 +1,17 @@
 const API_URL = process.env.NEXT_PUBLIC_API_URL!;
 const USER_KEY = "currentUser";
+const TOKEN_KEY = "accessToken";
 
 export interface EquipmentPayload {
   equipment: string[];
 }
 
+export interface Note {
+  id: number;
+  note: string;
+  createdAt: string;
+}
+
 export interface Recipe {
   id: string;
   title: string;
@@ -22,7 +29,13 @@ export interface RecipeDetail extends Recipe {
   instructions: string[];
   userRating: number;
   userNotes: string[];
+  // your newest notes (oldest first) and how many you have in total
+  notes: Note[];
+  noteCount: number;
   isMasterRecipe: boolean;
+  // set on a personal copy: the master it follows, and the fields it changes
+  parentId: number | null;
+  overrides: string[];
 }
 
 export interface RecipeFormData {
@@ -68,7 +81,10 @@ export async function login(
       "Login failed";
     throw new Error(msg);
   }
+  const data = await res.json().catch(() => ({}));
   localStorage.setItem(USER_KEY, email);
+  if (data.access_token) localStorage.setItem(TOKEN_KEY, data.access_token);
+  else localStorage.removeItem(TOKEN_KEY);
   return { status: "ok" };
 }
 
@@ -78,6 +94,15 @@ function getCurrentUser(): string {
   return user;
 }
 
+// fetch() plus the bearer token from /login, so the API can identify the
+// caller without looking the username up on every request.
+function authFetch(input: string, init: RequestInit = {}): Promise<Response> {
+  const token = localStorage.getItem(TOKEN_KEY);
+  const headers = new Headers(init.headers);
+  if (token) headers.set("Authorization", `Bearer ${token}`);
+  return fetch(input, { ...init, headers });
+}
+
 // --- Equipment --------------------------------------------
 
 export async function fetchAllEquipment(): Promise<EquipmentPayload> {
@@ -88,14 +113,14 @@ export async function fetchAllEquipment(): Promise<EquipmentPayload> {
 
 export async function fetchEquipment(): Promise<EquipmentPayload> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/users/${encodeURIComponent(user)}/equipment`);
+  const res = await authFetch(`${API_URL}/users/${encodeURIComponent(user)}/equipment`);
   if (!res.ok) throw new Error("Failed to fetch equipment");
   return res.json();
 }
 
 export async function saveEquipment(equipment: string[]): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(
+  const res = await authFetch(
     `${API_URL}/users/${encodeURIComponent(user)}/equipment`,
     {
       method: "PUT",
@@ -116,7 +141,7 @@ export async function fetchRecipes(
   const qs = new URLSearchParams();
   qs.append("username", user);
   equipment.forEach((e) => qs.append("equipment", e));
-  const res = await fetch(`${API_URL}/recipies?${qs}`);
+  const res = await authFetch(`${API_URL}/recipies?${qs}`);
   if (!res.ok) throw new Error("Failed to fetch recipes");
   return res.json();
 }
@@ -129,7 +154,7 @@ export async function fetchMasterRecipes(equipment: string[]): Promise<Recipe[]>
     equipment.forEach(e => params.append("equipment", e));
     console.log('Fetching master recipes with equipment:', equipment);
     
-    const response = await fetch(`${API_URL}/master/recipies?${params}`, {
+    const response = await authFetch(`${API_URL}/master/recipies?${params}`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
@@ -173,7 +198,7 @@ export async function fetchMasterRecipes(equipment: string[]): Promise<Recipe[]>
 
 export async function fetchRecipeById(id: string): Promise<RecipeDetail> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipie/${id}?username=${user}`);
+  const res = await authFetch(`${API_URL}/recipie/${id}?username=${user}`);
   if (!res.ok) throw new Error("Failed to fetch recipe");
   return res.json();
 }
@@ -182,7 +207,7 @@ export async function createRecipe(
   data: RecipeFormData
 ): Promise<{ id: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies?username=${user}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
@@ -202,7 +227,7 @@ export async function updateRecipe(
   data: RecipeFormData
 ): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies/${id}?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies/${id}?username=${user}`, {
     method: "PUT",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
@@ -226,7 +251,7 @@ export async function updateRecipe(
 
 export async function deleteRecipe(id: string): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies/${id}?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies/${id}?username=${user}`, {
     method: "DELETE",
   });
   if (!res.ok) {
@@ -243,7 +268,7 @@ export async function saveAsMyVersion(
   data: RecipeFormData
 ): Promise<{ id: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies/${id}/clone?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies/${id}/clone?username=${user}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
@@ -265,7 +290,7 @@ export async function saveRating(
   rating: number
 ): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies/${id}/rating?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies/${id}/rating?username=${user}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ rating }),
@@ -277,24 +302,24 @@ export async function saveRating(
 export async function addNote(
   id: string,
   note: string
-): Promise<{ status: string }> {
+): Promise<{ status: string; id: number }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/recipies/${id}/notes?username=${user}`, {
+  const res = await authFetch(`${API_URL}/recipies/${id}/notes?username=${user}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ note }),
   });
   if (!res.ok) throw new Error("Failed to add note");
-  return { status: "ok" };
+  return res.json();
 }
 
 export async function deleteNote(
   id: string,
-  noteIndex: number
+  noteId: number
 ): Promise<{ status: string }> {  
   const user = getCurrentUser();  
-  const res = await fetch(
-    `${API_URL}/recipies/${id}/notes/${noteIndex}?username=${user}`,
+  const res = await authFetch(
+    `${API_URL}/recipies/${id}/notes/${noteId}?username=${user}`,
     { method: "DELETE" }
   );
   if (!res.ok) throw new Error("Failed to delete note");
@@ -307,7 +332,7 @@ export async function fetchAllRecipes(): Promise<{ recipes: RecipeDetail[] }> {
   const user = getCurrentUser();
   console.log('Fetching all recipes for admin user:', user);
   
-  const res = await fetch(`${API_URL}/admin/recipes?username=${user}`, {
+  const res = await authFetch(`${API_URL}/admin/recipes?username=${user}`, {
     credentials: "include"
   });
   if (!res.ok) {
@@ -328,7 +353,7 @@ export async function createMasterRecipe(
   data: RecipeFormData
 ): Promise<{ id: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/admin/recipes?username=${user}`, {
+  const res = await authFetch(`${API_URL}/admin/recipes?username=${user}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     credentials: "include",
@@ -354,7 +379,7 @@ export async function updateMasterRecipe(
   data: RecipeFormData
 ): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/admin/recipes/${id}?username=${user}`, {
+  const res = await authFetch(`${API_URL}/admin/recipes/${id}?username=${user}`, {
     method: "PUT",
     headers: { "Content-Type": "application/json" },
     credentials: "include",
@@ -379,7 +404,7 @@ export async function deleteMasterRecipe(
   id: string
 ): Promise<{ status: string }> {
   const user = getCurrentUser();
-  const res = await fetch(`${API_URL}/admin/recipes/${id}?username=${user}`, {
+  const res = await authFetch(`${API_URL}/admin/recipes/${id}?username=${user}`, {
     method: "DELETE",
     credentials: "include"
   });
@@ -396,7 +421,7 @@ export async function isAdmin(): Promise<boolean> {
   try {
     const user = getCurrentUser();
     console.log('Checking admin status for user:', user);
-    const res = await fetch(`${API_URL}/users/${encodeURIComponent(user)}/role`, {
+    const res = await authFetch(`${API_URL}/users/${encodeURIComponent(user)}/role`, {
       headers: {
         'Content-Type': 'application/json'
       },
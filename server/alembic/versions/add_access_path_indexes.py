@@ -0,0 +1,46 @@
+"""add foreign-key and access-path indexes
+
+Revision ID: add_access_path_indexes
+Revises: add_ratings_recipe_user_unique
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_access_path_indexes'
+down_revision: Union[str, None] = 'add_ratings_recipe_user_unique'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns): checked by tests/test_query_plans.py against every endpoint
+INDEXES = [
+    # child collections, loaded with recipe_id IN (...)
+    ('ix_recipe_utensils_recipe_id', 'recipe_utensils', ['recipe_id']),
+    ('ix_recipe_ingredients_recipe_id', 'recipe_ingredients', ['recipe_id']),
+    ('ix_recipe_instructions_recipe_id', 'recipe_instructions', ['recipe_id']),
+    ('ix_notes_recipe_id', 'notes', ['recipe_id']),
+    # a user's equipment
+    ('ix_user_utensils_user_id', 'user_utensils', ['user_id']),
+    # a user's ratings; uq_ratings_recipe_id_user_id serves the per-recipe side
+    ('ix_ratings_user_id_recipe_id_rating', 'ratings', ['user_id', 'recipe_id', 'rating']),
+    # personal and master recipe lists, both walked in id order
+    ('ix_recipes_user_id_is_master_recipe', 'recipes', ['user_id', 'is_master_recipe', 'id']),
+    ('ix_recipes_is_master_recipe_id', 'recipes', ['is_master_recipe', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,69 @@
+"""notes belong to a user and carry a creation time
+
+Who wrote the existing notes was never recorded, so only those it can be
+worked out for are attributed:
+
+- notes on personal recipes go to the recipe's owner, the only user who
+  could see them;
+- notes on master recipes, which any user could have written, and notes
+  whose recipe is gone keep user_id NULL. They stay in the table as a
+  legacy bucket: every notes query filters on user_id, so they are shown
+  to nobody, and they can still be reassigned by hand. No note is
+  deleted or given to a user who did not write it.
+
+Downgrading drops the attribution and creation times; the notes
+themselves are kept.
+
+Revision ID: add_note_owner_created_at
+Revises: add_access_path_indexes
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_note_owner_created_at'
+down_revision: Union[str, None] = 'add_access_path_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+
+    # Only a personal recipe's notes have a known author: its owner. The
+    # rest stay unattributed (user_id NULL, see above).
+    connection.execute(text(
+        """
+        UPDATE notes
+        SET user_id = (
+            SELECT recipes.user_id FROM recipes
+            WHERE recipes.id = notes.recipe_id AND recipes.is_master_recipe = 0
+        )
+        """
+    ))
+
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.create_foreign_key('fk_notes_user_id_users', 'users', ['user_id'], ['id'])
+        batch_op.create_index(
+            'ix_notes_user_id_recipe_id_created_at', ['user_id', 'recipe_id', 'created_at', 'id'], unique=False
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.drop_index('ix_notes_user_id_recipe_id_created_at')
+        batch_op.drop_constraint('fk_notes_user_id_users', type_='foreignkey')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('user_id')
@@ -0,0 +1,58 @@
+"""one rating per (recipe_id, user_id)
+
+Revision ID: add_ratings_recipe_user_unique
+Revises: add_recipe_rating_stats
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_ratings_recipe_user_unique'
+down_revision: Union[str, None] = 'add_recipe_rating_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+
+    # Keep only the newest rating of each (recipe, user) pair
+    connection.execute(text(
+        """
+        DELETE FROM ratings
+        WHERE id NOT IN (SELECT MAX(id) FROM ratings GROUP BY recipe_id, user_id)
+        """
+    ))
+
+    # batch mode so SQLite (which can't ALTER in constraints) gets a table copy
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.create_unique_constraint('uq_ratings_recipe_id_user_id', ['recipe_id', 'user_id'])
+
+    # The duplicates were counted in recipe_rating_stats; rebuild it
+    connection.execute(text("DELETE FROM recipe_rating_stats"))
+    connection.execute(text(
+        """
+        INSERT INTO recipe_rating_stats
+            (recipe_id, count, total, stars_1, stars_2, stars_3, stars_4, stars_5)
+        SELECT recipe_id, COUNT(*), SUM(rating),
+               SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END)
+        FROM ratings
+        GROUP BY recipe_id
+        """
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.drop_constraint('uq_ratings_recipe_id_user_id', type_='unique')
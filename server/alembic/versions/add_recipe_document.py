@@ -0,0 +1,66 @@
+"""recipes carry their lists as a JSON document
+
+Revision ID: add_recipe_document
+Revises: add_note_owner_created_at
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recipe_document'
+down_revision: Union[str, None] = 'add_note_owner_created_at'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+DOCUMENT_TYPE = sa.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+# document key -> (child table, value column); a list's order is its id order
+CHILDREN = {
+    'utensils': ('recipe_utensils', 'utensil'),
+    'ingredients': ('recipe_ingredients', 'text'),
+    'instructions': ('recipe_instructions', 'step'),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.add_column(sa.Column('document', DOCUMENT_TYPE, nullable=True))
+
+    # Backfill every recipe's document from its child rows, so either
+    # RECIPE_STORAGE setting works straight after the upgrade
+    connection = op.get_bind()
+    recipes = sa.table('recipes', sa.column('id', sa.Integer), sa.column('document', DOCUMENT_TYPE))
+    ids = [row[0] for row in connection.execute(sa.select(recipes.c.id).order_by(recipes.c.id))]
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        documents = {recipe_id: {key: [] for key in CHILDREN} for recipe_id in batch}
+        for key, (name, column) in CHILDREN.items():
+            child = sa.table(name, sa.column('id', sa.Integer), sa.column('recipe_id', sa.Integer), sa.column(column))
+            rows = connection.execute(
+                sa.select(child.c.recipe_id, child.c[column])
+                .where(child.c.recipe_id.in_(batch))
+                .order_by(child.c.recipe_id, child.c.id)
+            )
+            for recipe_id, value in rows:
+                documents[recipe_id][key].append(value)
+        connection.execute(
+            recipes.update().where(recipes.c.id == sa.bindparam('recipe_id')),
+            [{'recipe_id': recipe_id, 'document': doc} for recipe_id, doc in documents.items()],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Recipes written in document mode have no ingredient or instruction
+    # rows: run `python storage.py unpack` before downgrading.
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.drop_column('document')
@@ -0,0 +1,90 @@
+"""personal copies store only their changes over a master recipe
+
+Revision ID: add_recipe_overlays
+Revises: add_recipe_document
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recipe_overlays'
+down_revision: Union[str, None] = 'add_recipe_document'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+JSON_TYPE = sa.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+# overrides key -> (child table, value column); a list's order is its id order
+CHILDREN = {
+    'utensils': ('recipe_utensils', 'utensil'),
+    'ingredients': ('recipe_ingredients', 'text'),
+    'instructions': ('recipe_instructions', 'step'),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Copies cloned before this revision can't be told apart from other
+    # personal recipes and stay full copies.
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('overrides', JSON_TYPE, nullable=True))
+        batch_op.create_foreign_key('fk_recipes_parent_id_recipes', 'recipes', ['parent_id'], ['id'])
+        batch_op.create_index('ix_recipes_parent_id', ['parent_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Give every copy its full content back: the master's value for each
+    # field it doesn't override, written to its own columns, rows and document.
+    # Masters' lists are read from their rows: under RECIPE_STORAGE=document,
+    # run `python storage.py unpack` first.
+    connection = op.get_bind()
+    recipes = sa.table(
+        'recipes',
+        sa.column('id', sa.Integer),
+        sa.column('title', sa.String),
+        sa.column('description', sa.String),
+        sa.column('parent_id', sa.Integer),
+        sa.column('overrides', JSON_TYPE),
+        sa.column('document', JSON_TYPE),
+    )
+    copies = connection.execute(
+        sa.select(recipes.c.id, recipes.c.parent_id, recipes.c.overrides).where(recipes.c.parent_id.isnot(None))
+    ).all()
+    for copy_id, parent_id, overrides in copies:
+        overrides = overrides or {}
+        parent = connection.execute(
+            sa.select(recipes.c.title, recipes.c.description).where(recipes.c.id == parent_id)
+        ).one()
+        lists = {}
+        for key, (name, column) in CHILDREN.items():
+            child = sa.table(name, sa.column('id', sa.Integer), sa.column('recipe_id', sa.Integer), sa.column(column))
+            if key in overrides:
+                lists[key] = list(overrides[key])
+            else:
+                lists[key] = list(connection.scalars(
+                    sa.select(child.c[column]).where(child.c.recipe_id == parent_id).order_by(child.c.id)
+                ))
+            connection.execute(child.delete().where(child.c.recipe_id == copy_id))
+            if lists[key]:
+                connection.execute(child.insert(), [{'recipe_id': copy_id, column: v} for v in lists[key]])
+        connection.execute(
+            recipes.update().where(recipes.c.id == copy_id).values(
+                title=overrides.get('title', parent.title),
+                description=overrides.get('description', parent.description),
+                document={key: lists[key] for key in CHILDREN},
+            )
+        )
+
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.drop_index('ix_recipes_parent_id')
+        batch_op.drop_constraint('fk_recipes_parent_id_recipes', type_='foreignkey')
+        batch_op.drop_column('overrides')
+        batch_op.drop_column('parent_id')
@@ -0,0 +1,55 @@
+"""add recipe_rating_stats aggregate table
+
+Revision ID: add_recipe_rating_stats
+Revises: add_recipe_utensils_lookup_index
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recipe_rating_stats'
+down_revision: Union[str, None] = 'add_recipe_utensils_lookup_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'recipe_rating_stats',
+        sa.Column('recipe_id', sa.Integer(), sa.ForeignKey('recipes.id'), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stars_1', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stars_2', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stars_3', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stars_4', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stars_5', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    # Backfill from the existing ratings
+    op.get_bind().execute(text(
+        """
+        INSERT INTO recipe_rating_stats
+            (recipe_id, count, total, stars_1, stars_2, stars_3, stars_4, stars_5)
+        SELECT recipe_id, COUNT(*), SUM(rating),
+               SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END)
+        FROM ratings
+        GROUP BY recipe_id
+        """
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('recipe_rating_stats')
@@ -0,0 +1,34 @@
+"""add (utensil, recipe_id) index on recipe_utensils
+
+Revision ID: add_recipe_utensils_lookup_index
+Revises: add_user_id_to_ratings, add_user_id_to_recipes
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recipe_utensils_lookup_index'
+down_revision: Union[str, Sequence[str], None] = ('add_user_id_to_ratings', 'add_user_id_to_recipes')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Serves the equipment filter on the recipe list endpoints:
+    # recipe_id IN (SELECT recipe_id FROM recipe_utensils WHERE utensil IN (...))
+    op.create_index(
+        'ix_recipe_utensils_utensil_recipe_id',
+        'recipe_utensils',
+        ['utensil', 'recipe_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipe_utensils_utensil_recipe_id', table_name='recipe_utensils')
@@ -0,0 +1,78 @@
+# server/auth.py
+
+import logging
+import os
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException
+from jose import JWTError, jwt
+
+import models
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+ACCESS_TOKEN_MINUTES = int(os.getenv("ACCESS_TOKEN_MINUTES", str(60 * 24)))
+
+if not JWT_SECRET_KEY:
+    # Never a constant: a random key per process. Tokens then stop working on
+    # restart and aren't accepted by other workers, so set it in production.
+    logger.warning("JWT_SECRET_KEY is not set; signing tokens with a random per-process key")
+    JWT_SECRET_KEY = secrets.token_urlsafe(32)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, as carried in the access token."""
+    id: int
+    username: str
+    role: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, username=user.username, role=user.role)
+
+
+def create_access_token(user: models.User) -> str:
+    expires = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    claims = {
+        "sub": str(user.id),
+        "name": user.username,
+        "role": user.role,
+        "exp": expires,
+    }
+    return jwt.encode(claims, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def decode_access_token(token: str) -> Principal:
+    try:
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        return Principal(id=int(claims["sub"]), username=claims["name"], role=claims["role"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(401, "Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+
+def get_principal(authorization: Optional[str] = Header(None)) -> Principal:
+    """
+    Resolve the caller from "Authorization: Bearer <token>" without touching
+    the database. Every protected route needs a valid token.
+    """
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            return decode_access_token(token)
+    raise HTTPException(401, "Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+def require_admin(principal: Principal = Depends(get_principal)) -> Principal:
+    if not principal.is_admin:
+        raise HTTPException(403, "Admin access required")
+    return principal
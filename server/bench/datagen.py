@@ -0,0 +1,175 @@
+# server/bench/datagen.py
+"""
+Seeded synthetic data for benchmarks and local load testing.
+
+    python -m bench.datagen --users 200 --masters 500 --database-url sqlite:///./bench.db
+
+The same seed and sizes always produce the same rows. Every user's
+password is "password".
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+# Recipe vocabulary: enough variety for the duplicate and recommendation
+# indexes to have something to work with.
+ORIGINS = ["Ethiopian", "Colombian", "Kenyan", "Brazilian", "Guatemalan", "Sumatran", "Costa Rican", "Rwandan"]
+STYLES = ["Bright", "Classic", "Bold", "Smooth", "Iced", "Honey", "Spiced", "Double"]
+VERBS = ["Bloom", "Stir", "Pour", "Steep", "Swirl", "Press", "Grind", "Heat", "Rest", "Serve"]
+EXTRAS = ["milk", "oat milk", "sugar", "cinnamon", "vanilla syrup", "ice", "cream", "honey", "cardamom"]
+
+INSERT_BATCH = 1000
+
+
+@dataclass
+class Sizes:
+    users: int = 100
+    masters: int = 200
+    personal_per_user: int = 5
+    ratings_per_user: int = 20
+    notes_per_user: int = 10
+    seed: int = 42
+
+
+def _recipe(rng: random.Random, n: int) -> dict:
+    origin, style = rng.choice(ORIGINS), rng.choice(STYLES)
+    grams = rng.randint(12, 40)
+    return {
+        "title": f"{style} {origin} #{n}",
+        "description": f"A {style.lower()} cup from {origin} beans.",
+        "ingredients": [f"{grams}g {origin} coffee", f"{grams * 16}ml water"]
+                       + rng.sample(EXTRAS, rng.randint(0, 3)),
+        "instructions": [
+            f"{rng.choice(VERBS)} for {rng.randint(10, 240)} seconds" for _ in range(rng.randint(3, 8))
+        ],
+    }
+
+
+def _insert(db, model, rows: List[dict]) -> None:
+    from sqlalchemy import insert
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.execute(insert(model), rows[start:start + INSERT_BATCH])
+
+
+def generate(db, sizes: Sizes) -> Dict[str, object]:
+    """
+    Fill an empty database through `db` (a sync Session) and commit.
+    Returns the ids the benchmark needs, plus row counts.
+    """
+    import models
+    import ratings
+    import storage
+    from main import ALL_EQUIPMENT
+    from passwords import pwd_context
+    from sqlalchemy import insert, select
+
+    rng = random.Random(sizes.seed)
+    started = time.perf_counter()
+    password = pwd_context.hash("password")
+
+    users = [{"username": "admin", "hashed_password": password, "role": "admin"}]
+    users += [{"username": f"user{i}", "hashed_password": password, "role": "user"} for i in range(sizes.users)]
+    _insert(db, models.User, users)
+    ids = dict(db.execute(select(models.User.username, models.User.id)).all())
+    admin_id = ids["admin"]
+    user_ids = [ids[u["username"]] for u in users[1:]]
+
+    _insert(db, models.UserUtensil, [
+        {"user_id": uid, "utensil": u}
+        for uid in user_ids for u in rng.sample(ALL_EQUIPMENT, rng.randint(1, 3))
+    ])
+
+    owners = [(admin_id, 1)] * sizes.masters + [
+        (uid, 0) for uid in user_ids for _ in range(sizes.personal_per_user)
+    ]
+    bodies = [_recipe(rng, n) for n in range(len(owners))]
+    for b in bodies:
+        b["utensils"] = rng.sample(ALL_EQUIPMENT, rng.randint(1, 2))
+    recipe_ids = sorted(db.scalars(
+        insert(models.Recipe).returning(models.Recipe.id),
+        [
+            {
+                "title": b["title"],
+                "description": b["description"],
+                "user_id": owner,
+                "is_master_recipe": master,
+                "document": storage.document(b) if storage.DOCUMENT else None,
+            }
+            for b, (owner, master) in zip(bodies, owners)
+        ],
+    ).all())
+
+    # Child rows in the layout RECIPE_STORAGE selects
+    for name, model, column in storage.ROW_CHILDREN:
+        _insert(db, model, [{"recipe_id": rid, column: v} for rid, b in zip(recipe_ids, bodies) for v in b[name]])
+
+    masters = recipe_ids[:sizes.masters]
+    personal: Dict[int, List[int]] = {uid: [] for uid in user_ids}
+    for rid, (owner, master) in zip(recipe_ids, owners):
+        if not master:
+            personal[owner].append(rid)
+
+    rating_rows, note_rows = [], []
+    for uid in user_ids:
+        # Skewed popularity: low-numbered master recipes get rated more
+        pool = masters + personal[uid]
+        picked = set()
+        while len(picked) < min(sizes.ratings_per_user, len(pool)):
+            picked.add(pool[min(int(rng.expovariate(4 / len(pool))), len(pool) - 1)])
+        rating_rows += [{"recipe_id": rid, "user_id": uid, "rating": rng.randint(1, 5)} for rid in picked]
+        note_rows += [
+            {"recipe_id": rng.choice(pool), "user_id": uid, "content": f"note {n} from user {uid}"}
+            for n in range(sizes.notes_per_user)
+        ]
+    _insert(db, models.Rating, rating_rows)
+    _insert(db, models.Note, note_rows)
+    db.commit()
+    ratings.reconcile(db)
+
+    return {
+        "adminId": admin_id,
+        "userIds": user_ids,
+        "masterIds": masters,
+        "personalIds": personal,
+        "counts": {
+            "users": len(users),
+            "recipes": len(recipe_ids),
+            "ratings": len(rating_rows),
+            "notes": len(note_rows),
+        },
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def size_arguments(parser: argparse.ArgumentParser):
+    defaults = Sizes()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=value)
+
+
+def sizes_from(args: argparse.Namespace) -> Sizes:
+    return Sizes(**{field: getattr(args, field) for field in asdict(Sizes())})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="an empty database to fill")
+    size_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # database.py reads DATABASE_URL on import
+    os.environ["DATABASE_URL"] = args.database_url
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        result = generate(db, sizes_from(args))
+    print(f"Generated {result['counts']} in {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
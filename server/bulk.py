@@ -0,0 +1,244 @@
+# server/bulk.py
+
+import csv
+import io
+import json
+import logging
+import time
+from typing import AsyncIterator, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+import listing
+import storage
+from catalog import bump_catalog
+from dedupe import duplicates
+from schemas import RecipeImport
+
+logger = logging.getLogger(__name__)
+
+CSV_MEDIA_TYPE = "text/csv"
+
+# Column order for CSV import/export; list columns hold JSON arrays
+CSV_COLUMNS = ["title", "description", "equipment", "ingredients", "instructions"]
+LIST_COLUMNS = ("equipment", "ingredients", "instructions")
+
+# Valid rows written per transaction
+IMPORT_CHUNK_SIZE = 500
+
+# Per-row errors echoed back in the report (the count is always exact)
+MAX_REPORTED_ERRORS = 100
+
+
+# --- Parsing ---
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a byte stream into lines without buffering the whole body. Lines
+    stay bytes: the parsers decode them, so bad UTF-8 fails only its row.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield line
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, RecipeImport or error message) per non-blank line."""
+    number = 0
+    async for raw in _lines(chunks):
+        number += 1
+        if not raw.strip():
+            continue
+        try:
+            yield number, RecipeImport(**json.loads(raw.decode("utf-8")))
+        except (ValueError, TypeError, ValidationError) as e:
+            yield number, str(e)
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Like parse_ndjson for CSV with a header row. Quoted fields may span
+    lines: physical lines are joined until the quotes balance.
+    """
+    header = None
+    record, first_line, number = "", 0, 0
+    async for raw in _lines(chunks):
+        number += 1
+        if not record:
+            first_line = number
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # fails the record the line belongs to; the next line starts a new one
+            yield first_line, str(e)
+            record = ""
+            continue
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # inside a quoted field
+        text, record = record.rstrip("\r"), ""
+        if not text.strip():
+            continue
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [f.strip() for f in fields]
+            continue
+        try:
+            row = dict(zip(header, fields))
+            for col in LIST_COLUMNS:
+                if row.get(col):
+                    row[col] = json.loads(row[col])
+                else:
+                    row.pop(col, None)
+            yield first_line, RecipeImport(**row)
+        except (ValueError, TypeError, ValidationError) as e:
+            yield first_line, str(e)
+    if record:
+        yield first_line, "Unterminated quoted field"
+
+
+# --- Import ---
+
+def _children(row: RecipeImport) -> dict:
+    return {"utensils": row.equipment, "ingredients": row.ingredients, "instructions": row.instructions}
+
+
+async def _insert_chunk(db: AsyncSession, rows: List[RecipeImport], owner_id: int) -> List[int]:
+    """A multi-row INSERT per table; returns the new ids in `rows` order. The caller commits."""
+    # sort_by_parameter_order: RETURNING by itself promises no order, and
+    # the child rows are matched to recipes by position
+    ids = (await db.scalars(
+        insert(models.Recipe).returning(models.Recipe.id, sort_by_parameter_order=True),
+        [
+            {
+                "title": r.title,
+                "description": r.description,
+                "is_master_recipe": 1,
+                "user_id": owner_id,
+                "document": storage.document(_children(r)) if storage.DOCUMENT else None,
+            }
+            for r in rows
+        ],
+    )).all()
+
+    for name, model, column in storage.ROW_CHILDREN:
+        values = [
+            {"recipe_id": recipe_id, column: v}
+            for recipe_id, r in zip(ids, rows) for v in _children(r)[name]
+        ]
+        if values:
+            await db.execute(insert(model), values)
+    return list(ids)
+
+
+def _db_error(e: Exception) -> str:
+    # The driver's message, without the statement and parameters
+    return f"Database error: {str(getattr(e, 'orig', None) or e).splitlines()[0]}"
+
+
+async def import_recipes(db: AsyncSession, parsed: AsyncIterator[Tuple[int, object]], owner_id: int) -> dict:
+    """
+    Insert master recipes from `parsed` in IMPORT_CHUNK_SIZE transactions.
+
+    Invalid rows are reported and skipped. A chunk the database rejects is
+    rolled back and retried row by row, so only the rows it rejects are
+    reported, each with its own error; later chunks still load.
+    """
+    started = time.perf_counter()
+    imported, failed, errors = 0, 0, []
+
+    def fail(line: int, error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "error": error})
+
+    chunk: List[Tuple[int, RecipeImport]] = []
+
+    async def flush():
+        nonlocal imported
+        try:
+            ids = await _insert_chunk(db, [r for _, r in chunk], owner_id)
+            await db.run_sync(bump_catalog)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.warning("Import chunk starting at line %d failed; retrying row by row", chunk[0][0])
+            # One SAVEPOINT per row: the good rows still load, and each bad
+            # one is reported with its own error
+            ids = []
+            for line, row in chunk:
+                try:
+                    async with db.begin_nested():
+                        ids += await _insert_chunk(db, [row], owner_id)
+                except Exception as e:
+                    fail(line, _db_error(e))
+            if ids:
+                await db.run_sync(bump_catalog)
+            await db.commit()
+        imported += len(ids)
+        for recipe_id in ids:
+            duplicates.touch(recipe_id)
+        chunk.clear()
+
+    async for line, row in parsed:
+        if isinstance(row, str):
+            fail(line, row)
+            continue
+        chunk.append((line, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    seconds = time.perf_counter() - started
+    logger.info("Imported %d recipes (%d failed) in %.2fs", imported, failed, seconds)
+    return {
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(imported / seconds, 1) if seconds else 0.0,
+    }
+
+
+# --- Export ---
+
+def _export_rows(db: Session) -> Iterator[dict]:
+    query = listing.master_recipes(db).options(*listing.DETAIL_LOADERS)
+    for r in query.yield_per(listing.STREAM_BATCH_SIZE):
+        yield {
+            "title": r.title,
+            "description": r.description or "",
+            "equipment": storage.values(r, "utensils"),
+            "ingredients": storage.values(r, "ingredients"),
+            "instructions": storage.values(r, "instructions"),
+        }
+
+
+def export_ndjson(db: Session) -> Iterator[bytes]:
+    for row in _export_rows(db):
+        yield json.dumps(row).encode() + b"\n"
+
+
+def export_csv(db: Session) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for row in _export_rows(db):
+        for col in LIST_COLUMNS:
+            row[col] = json.dumps(row[col])
+        writer.writerow([row[c] for c in CSV_COLUMNS])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue().encode()
@@ -0,0 +1,117 @@
+# server/catalog.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+import models
+
+# Views of the master catalog kept at once (the full catalog plus one entry
+# per distinct equipment filter); least recently used views are dropped first.
+MAX_ENTRIES = 64
+
+# The catalog_version row
+VERSION_ROW = 1
+
+
+def bump_catalog(db: Session):
+    """
+    Move the shared catalog version on. Call it in the transaction that
+    changes master recipes, before the commit: every worker sees the new
+    version together with the change.
+    """
+    table = models.CatalogVersion
+    moved = db.execute(
+        update(table).where(table.id == VERSION_ROW).values(version=table.version + 1)
+    ).rowcount
+    if not moved:
+        db.execute(insert(table).values(id=VERSION_ROW, version=1))
+
+
+class CatalogCache:
+    """
+    Process-local cache of the master recipe catalog.
+
+    Every entry is tagged with the catalog version (catalog_version) it was
+    built from. Callers pass the version they just read; once it moves past
+    the cached one, everything built from the old version is dropped. Each
+    worker keeps its own copy, but all of them follow the same version, so
+    one worker's write invalidates every worker's cache and equal ETags
+    always mean equal content.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _advance(self, version: int):
+        # Caller holds the lock. A lagging replica may report an older
+        # version than the cache holds; that never rolls it back.
+        if version > self.version:
+            self.version = version
+            self._entries.clear()
+
+    def get_or_build(self, key: Hashable, version: int, build: Callable[[], Any]) -> Any:
+        """
+        The view under `key` for catalog `version` or newer. build() makes
+        one and returns it with the version it was built from in "version".
+        """
+        with self._lock:
+            self._advance(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Built outside the lock so a slow rebuild doesn't block readers of
+        # other views.
+        value = build()
+
+        with self._lock:
+            self._advance(value["version"])
+            # Don't store a view of a catalog that has moved on meanwhile
+            if value["version"] == self.version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def etag(version: int, ratings: Dict[int, int], notes: Optional[Dict] = None, extra: Optional[str] = None) -> str:
+    """
+    Weak ETag for a catalog response: the shared catalog version plus a
+    digest of the caller's ratings and notes, the only per-user parts of
+    the payload. Notes are never edited in place, so their ids and counts
+    stand for them.
+    """
+    digest = hashlib.sha1(repr(sorted(ratings.items())).encode())
+    if notes:
+        digest.update(repr(sorted(
+            (recipe_id, count, [n["id"] for n in latest]) for recipe_id, (count, latest) in notes.items()
+        )).encode())
+    if extra:
+        digest.update(extra.encode())
+    return f'W/"{version}-{digest.hexdigest()[:16]}"'
+
+
+catalog = CatalogCache()
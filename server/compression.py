@@ -0,0 +1,242 @@
+# server/compression.py
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this go out uncompressed: the saving doesn't pay
+# for the CPU, and tiny bodies can even grow.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Total size of precompressed bodies kept by compressed_response()
+COMPRESSED_CACHE_BYTES = int(os.getenv("COMPRESSED_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# In order of preference when the client rates them equally
+ENCODINGS = (("br",) if brotli is not None else ()) + ("gzip",)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for an Accept-Encoding header, or None for identity."""
+    offered: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        offered[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _gzip_compressor():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip framing
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    c = _gzip_compressor()
+    return c.compress(body) + c.flush()
+
+
+class _Stream:
+    """Incremental compressor; every chunk is flushed so streamed lines arrive promptly."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = _gzip_compressor()
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._c.finish()
+        return self._c.flush()
+
+
+def _compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+# --- Precompressed bodies ---
+
+class CompressedCache:
+    """
+    Compressed response bodies keyed by (content key, encoding), least
+    recently used dropped first once past `max_bytes`. Content keys carry
+    their own version (a catalog ETag, say), so a changed payload is a new
+    key and stale entries simply age out.
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[Hashable, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compress(self, key: Hashable, encoding: str, body: bytes) -> bytes:
+        with self._lock:
+            cached = self._entries.get((key, encoding))
+            if cached is not None:
+                self._entries.move_to_end((key, encoding))
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        data = compress(body, encoding)
+
+        with self._lock:
+            if (key, encoding) not in self._entries and len(data) <= self.max_bytes:
+                self._entries[(key, encoding)] = data
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, dropped = self._entries.popitem(last=False)
+                    self.size -= len(dropped)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+compressed = CompressedCache()
+
+
+def compressed_response(
+    request: Request,
+    body: bytes,
+    key: Hashable,
+    media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Response for a cacheable payload: `key` must change whenever `body`
+    does. The body is compressed at most once per key and encoding, and the
+    middleware leaves the result alone.
+    """
+    headers = dict(headers or {}, Vary="Accept-Encoding")
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return Response(body, media_type=media_type, headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(compressed.get_or_compress(key, encoding, body), media_type=media_type, headers=headers)
+
+
+# --- Middleware ---
+
+class CompressionMiddleware:
+    """
+    Compresses JSON, NDJSON and text responses with the best encoding the
+    client accepts. Single-chunk bodies under COMPRESS_MIN_BYTES are sent
+    as they are; streamed bodies are compressed chunk by chunk. Responses
+    that already carry a Content-Encoding (compressed_response) pass through.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), "")
+        encoding = negotiate(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        stream: Optional[_Stream] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, stream, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = b"content-encoding" in headers or not _compressible(content_type)
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if start is not None:
+                # first body chunk: decide how this response goes out
+                headers = _without(start.get("headers", []), b"content-length")
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more:
+                    body = compress(body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send(dict(start, headers=headers))
+                    start = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                stream = _Stream(encoding)
+                await send(dict(start, headers=headers))
+                start = None
+
+            out = stream.chunk(body) if body else b""
+            if not more:
+                out += stream.finish()
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _without(headers: List[Tuple[bytes, bytes]], name: bytes) -> List[Tuple[bytes, bytes]]:
+    return [(k, v) for k, v in headers if k.lower() != name]
@@ -0,0 +1,255 @@
+# server/dedupe.py
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Signature length = LSH_BANDS x LSH_ROWS. Two recipes land in a shared
+# bucket with probability 1 - (1 - J^rows)^bands for Jaccard similarity J;
+# 16 x 8 puts the 50% point near J = 0.7.
+LSH_BANDS = 16
+LSH_ROWS = 8
+NUM_PERM = LSH_BANDS * LSH_ROWS
+
+# Estimated Jaccard similarity at or above which a candidate is reported
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.7"))
+
+# Rebuild from the database once the index is this old, to pick up writes
+# made by other worker processes.
+DEDUPE_REBUILD_SECONDS = int(os.getenv("DEDUPE_REBUILD_SECONDS", "3600"))
+
+# Words per shingle
+SHINGLE_WORDS = 3
+
+# Recipes loaded per round trip while (re)building
+LOAD_BATCH_SIZE = 500
+
+# Multiply-shift hashing: h(x) = ((a*x + b) mod 2**64) >> 32 with a odd.
+# The mod 2**64 is uint64 wraparound; a fixed seed keeps signatures stable
+# across processes.
+_rng = np.random.default_rng(20240320)
+_A = _rng.integers(0, 1 << 64, size=NUM_PERM, dtype=np.uint64, endpoint=False) | np.uint64(1)
+_B = _rng.integers(0, 1 << 64, size=NUM_PERM, dtype=np.uint64, endpoint=False)
+_SHIFT = np.uint64(32)
+_EMPTY = np.iinfo(np.uint64).max
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def shingles(title: str, ingredients: Iterable[str], instructions: Iterable[str]) -> Set[int]:
+    """Hashed word n-grams of a recipe's title, ingredients and steps."""
+    out = set()
+    for part in (title, *ingredients, *instructions):
+        words = _WORD.findall((part or "").lower())
+        if len(words) < SHINGLE_WORDS:
+            grams = [" ".join(words)] if words else []
+        else:
+            grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+        out.update(zlib.crc32(g.encode()) for g in grams)
+    return out
+
+
+def signature(hashed: Set[int]) -> np.ndarray:
+    """MinHash signature: the minimum of NUM_PERM universal hashes over the shingles."""
+    if not hashed:
+        return np.full(NUM_PERM, _EMPTY, dtype=np.uint64)
+    x = np.fromiter(hashed, dtype=np.uint64, count=len(hashed))
+    return ((np.outer(_A, x) + _B[:, None]) >> _SHIFT).min(axis=1)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity: the share of agreeing signature slots."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def _bands(sig: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [(band, sig[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()) for band in range(LSH_BANDS)]
+
+
+class DuplicateIndex:
+    """
+    MinHash/LSH index over every recipe (master and personal).
+
+    Write paths call touch() / forget() after committing; the changed
+    recipes are re-read and re-hashed on the next query. Like the catalog
+    cache the index lives in one worker process, and it is rebuilt every
+    DEDUPE_REBUILD_SECONDS to pick up other workers' writes.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, rebuild_seconds: int = DEDUPE_REBUILD_SECONDS):
+        self.threshold = threshold
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._info: Dict[int, Tuple[str, bool]] = {}  # id -> (title, is master)
+        self._buckets: Dict[Tuple[int, bytes], Set[int]] = defaultdict(set)
+        self._dirty: Set[int] = set()
+        self._gone: Set[int] = set()
+        self.built_at: Optional[float] = None
+
+    # --- write side ---
+
+    def touch(self, recipe_id: int):
+        with self._lock:
+            self._dirty.add(recipe_id)
+            self._gone.discard(recipe_id)
+
+    def forget(self, recipe_id: int):
+        with self._lock:
+            self._gone.add(recipe_id)
+            self._dirty.discard(recipe_id)
+
+    def _remove(self, recipe_id: int):
+        sig = self._signatures.pop(recipe_id, None)
+        self._info.pop(recipe_id, None)
+        if sig is not None:
+            for key in _bands(sig):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(recipe_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _add(self, recipe: models.Recipe):
+        title = storage.field(recipe, "title")
+        hashed = shingles(
+            title,
+            storage.values(recipe, "ingredients"),
+            storage.values(recipe, "instructions"),
+        )
+        sig = signature(hashed)
+        self._signatures[recipe.id] = sig
+        self._info[recipe.id] = (title, bool(recipe.is_master_recipe))
+        if not hashed:
+            return  # no text to compare; would otherwise match every other empty recipe
+        for key in _bands(sig):
+            self._buckets[key].add(recipe.id)
+
+    def _load(self, db: Session, recipe_ids: Optional[Iterable[int]] = None) -> Iterable[models.Recipe]:
+        q = (
+            select(models.Recipe)
+            .options(*storage.loaders("ingredients", "instructions"))
+            .order_by(models.Recipe.id)
+        )
+        if recipe_ids is not None:
+            q = q.where(models.Recipe.id.in_(list(recipe_ids)))
+        return db.scalars(q.execution_options(yield_per=LOAD_BATCH_SIZE))
+
+    # --- maintenance ---
+
+    def rebuild(self, db: Session):
+        started = time.perf_counter()
+        with self._lock:
+            self._signatures.clear()
+            self._info.clear()
+            self._buckets.clear()
+            self._dirty.clear()
+            self._gone.clear()
+            for recipe in self._load(db):
+                self._add(recipe)
+            self.built_at = time.monotonic()
+        logger.info("Built duplicate index over %d recipes in %.2fs", len(self._signatures), time.perf_counter() - started)
+
+    def refresh(self, db: Session):
+        """Build if missing or stale; otherwise re-hash touched recipes."""
+        if self.built_at is None or time.monotonic() - self.built_at > self.rebuild_seconds:
+            self.rebuild(db)
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            gone, self._gone = self._gone, set()
+            for recipe_id in gone | dirty:
+                self._remove(recipe_id)
+            if dirty:
+                for recipe in self._load(db, dirty):
+                    self._add(recipe)
+
+    # --- queries ---
+
+    def _candidates(self, sig: np.ndarray) -> Set[int]:
+        found = set()
+        for key in _bands(sig):
+            found |= self._buckets.get(key, set())
+        return found
+
+    def _ref(self, recipe_id: int) -> dict:
+        title, is_master = self._info[recipe_id]
+        return {"id": recipe_id, "title": title, "isMasterRecipe": is_master}
+
+    def duplicates_of(self, db: Session, recipe_id: int, threshold: Optional[float] = None) -> Optional[List[dict]]:
+        """Likely duplicates of one recipe, most similar first; None if it doesn't exist."""
+        threshold = self.threshold if threshold is None else threshold
+        self.refresh(db)
+        with self._lock:
+            sig = self._signatures.get(recipe_id)
+            if sig is None:
+                return None
+            scored = [
+                (other, similarity(sig, self._signatures[other]))
+                for other in self._candidates(sig) if other != recipe_id
+            ]
+            return [
+                dict(self._ref(other), similarity=round(score, 3))
+                for other, score in sorted(scored, key=lambda s: (-s[1], s[0]))
+                if score >= threshold
+            ]
+
+    def all_duplicates(self, db: Session, threshold: Optional[float] = None, master_only: bool = False) -> List[dict]:
+        """
+        Every likely duplicate pair in the catalog. Only recipes sharing an
+        LSH bucket are compared, so the work grows with the number of
+        near-duplicates rather than with the square of the catalog.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        self.refresh(db)
+        with self._lock:
+            seen: Set[Tuple[int, int]] = set()
+            pairs = []
+            for bucket in self._buckets.values():
+                if len(bucket) < 2:
+                    continue
+                members = sorted(
+                    r for r in bucket if not master_only or self._info[r][1]
+                )
+                for i, a in enumerate(members):
+                    for b in members[i + 1:]:
+                        if (a, b) in seen:
+                            continue
+                        seen.add((a, b))
+                        score = similarity(self._signatures[a], self._signatures[b])
+                        if score >= threshold:
+                            pairs.append((score, a, b))
+            pairs.sort(key=lambda p: (-p[0], p[1], p[2]))
+            return [
+                {"recipe": self._ref(a), "duplicate": self._ref(b), "similarity": round(score, 3)}
+                for score, a, b in pairs
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "recipes": len(self._signatures),
+                "buckets": len(self._buckets),
+                "bands": LSH_BANDS,
+                "rows": LSH_ROWS,
+                "threshold": self.threshold,
+                "pending": len(self._dirty) + len(self._gone),
+                "ageSeconds": round(time.monotonic() - self.built_at, 1) if self.built_at is not None else None,
+            }
+
+
+duplicates = DuplicateIndex()
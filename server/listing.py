@@ -0,0 +1,370 @@
+# server/listing.py
+
+import logging
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import and_, literal_column, null, or_, select, union_all
+from sqlalchemy.orm import Query, Session
+
+import models
+import notes
+import storage
+from catalog import VERSION_ROW
+from logs import RowSampler
+from schemas import RecipeDetailOut
+
+logger = logging.getLogger(__name__)
+rows = RowSampler(logger)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Largest page a client may ask for with ?limit=
+MAX_PAGE_SIZE = 500
+
+# Recipes pulled from the server-side cursor per round trip when streaming
+STREAM_BATCH_SIZE = 100
+
+# Every child collection a RecipeDetailOut needs. In normalized storage
+# selectinload issues one "SELECT ... WHERE recipe_id IN (...)" per collection
+# for the whole batch of recipes, so a page costs the same number of queries
+# whatever its size; in document storage the recipe rows carry them.
+# Notes are per user and come from notes.latest() instead.
+DETAIL_LOADERS = storage.loaders()
+
+NoteSummary = Tuple[int, List[Dict]]   # (note count, newest notes): a notes.latest() value
+NO_NOTES: NoteSummary = (0, [])
+
+
+# Both list queries are ordered by id: that is the keyset the pagination
+# cursor walks.
+
+def master_recipes(db: Session) -> Query:
+    return (
+        db.query(models.Recipe)
+          .filter(models.Recipe.is_master_recipe == 1)
+          .order_by(models.Recipe.id)
+    )
+
+
+def personal_recipes(db: Session, user_id: int) -> Query:
+    return (
+        db.query(models.Recipe)
+          .filter(
+              models.Recipe.is_master_recipe == 0,  # Only personal recipes
+              models.Recipe.user_id == user_id,     # Only this user's recipes
+          )
+          .order_by(models.Recipe.id)
+    )
+
+
+def with_equipment(query: Query, equipment: Optional[List[str]]) -> Query:
+    """
+    Keep only recipes that use at least one of `equipment`.
+
+    Runs as "recipes.id IN (SELECT recipe_id FROM recipe_utensils WHERE
+    utensil IN (...))", which ix_recipe_utensils_utensil_recipe_id answers
+    without touching recipes that don't match. A personal copy that doesn't
+    override its equipment (no "utensils" key in its overrides) matches
+    through its master's rows; one that does, even with an empty list,
+    matches only through its own.
+    """
+    if not equipment:
+        return query
+    matching = (
+        select(models.RecipeUtensil.recipe_id)
+        .where(models.RecipeUtensil.utensil.in_(equipment))
+    )
+    Recipe = models.Recipe
+    inherits = Recipe.overrides["utensils"].as_string().is_(None)
+    return query.filter(or_(Recipe.id.in_(matching), and_(Recipe.parent_id.in_(matching), inherits)))
+
+
+def keyset(query: Query, after: Optional[int], limit: Optional[int], lookahead: bool = True) -> Query:
+    """
+    Restrict `query` to the page of recipes with id > `after`.
+
+    With `lookahead`, one extra row past `limit` is fetched so split_page can
+    tell whether another page follows without a COUNT.
+    """
+    if after is not None:
+        query = query.filter(models.Recipe.id > after)
+    if limit is not None:
+        query = query.limit(limit + 1 if lookahead else limit)
+    return query
+
+
+def split_page(details: List[Dict], limit: Optional[int]) -> Tuple[List[Dict], Optional[int]]:
+    """Trim the look-ahead row added by keyset and return (page, next cursor)."""
+    if limit is None or len(details) <= limit:
+        return details, None
+    details = details[:limit]
+    return details, details[-1]["id"]
+
+
+def user_ratings(db: Session, user_id: int, recipe_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Map recipe id -> the user's rating, in a single query."""
+    q = db.query(models.Rating.recipe_id, models.Rating.rating).filter(models.Rating.user_id == user_id)
+    if recipe_ids is not None:
+        q = q.filter(models.Rating.recipe_id.in_(list(recipe_ids)))
+    return {recipe_id: rating for recipe_id, rating in q}
+
+
+def average_ratings(db: Session, recipe_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """
+    Map recipe id -> average rating across all users (rounded down), read
+    from the per-recipe aggregates rather than the ratings themselves.
+    """
+    stats = models.RecipeRatingStats
+    q = db.query(stats.recipe_id, stats.total, stats.count).filter(stats.count > 0)
+    if recipe_ids is not None:
+        q = q.filter(stats.recipe_id.in_(list(recipe_ids)))
+    return {recipe_id: total // count for recipe_id, total, count in q}
+
+
+def personal_overlay(
+    db: Session, user_id: int, recipe_ids: Optional[Iterable[int]] = None
+) -> Tuple[int, Dict[int, int], Dict[int, NoteSummary]]:
+    """
+    Everything per user a recipe response needs, in a single query: the
+    shared catalog version, the user's ratings (as user_ratings()) and
+    their newest notes (as notes.latest()), for `recipe_ids` or for every
+    recipe. The three are read as one UNION ALL, tagged by `kind`; the id
+    column carries the note id, the rating or the version.
+    """
+    ids = None if recipe_ids is None else list(recipe_ids)
+    ranked = notes.ranked(user_id, ids).subquery()
+    Rating, Version = models.Rating, models.CatalogVersion
+    rated = select(
+        literal_column("'rating'"), Rating.recipe_id, Rating.rating, null(), null(), null(), null()
+    ).where(Rating.user_id == user_id)
+    if ids is not None:
+        rated = rated.where(Rating.recipe_id.in_(ids))
+    version = select(
+        literal_column("'version'"), null(), Version.version, null(), null(), null(), null()
+    ).where(Version.id == VERSION_ROW)
+    both = union_all(
+        select(
+            literal_column("'note'").label("kind"), ranked.c.recipe_id, ranked.c.id, ranked.c.content,
+            ranked.c.created_at, ranked.c.rank, ranked.c.total,
+        ),
+        rated,
+        version,
+    ).subquery()
+    rows = db.execute(select(both).order_by(both.c.kind, both.c.recipe_id, both.c.rank.desc())).all()
+
+    current = next((r.id for r in rows if r.kind == "version"), 0)
+    ratings = {r.recipe_id: r.id for r in rows if r.kind == "rating"}
+    return current, ratings, notes.summarize(r for r in rows if r.kind == "note")
+
+
+def _personal(rating: int, summary: NoteSummary) -> Dict:
+    # The caller-specific fields of a RecipeDetailOut
+    count, latest = summary
+    return {
+        "userRating": rating,
+        "userNotes": [n["note"] for n in latest],
+        "notes": latest,
+        "noteCount": count,
+    }
+
+
+def to_detail(recipe: models.Recipe, rating: int, summary: NoteSummary = NO_NOTES) -> Dict:
+    """
+    A recipe as a plain dict with exactly RecipeDetailOut's fields.
+
+    Every value already has the type the schema declares, so handlers
+    encode these with dumps() and return the bytes, instead of building a
+    RecipeDetailOut per recipe for FastAPI to validate and encode again.
+    """
+    return {
+        "id": recipe.id,
+        "title": storage.field(recipe, "title"),
+        "description": storage.field(recipe, "description"),
+        "equipment": storage.values(recipe, "utensils"),
+        "ingredients": storage.values(recipe, "ingredients"),
+        "instructions": storage.values(recipe, "instructions"),
+        **_personal(rating, summary),
+        "isMasterRecipe": bool(recipe.is_master_recipe),
+        "parentId": recipe.parent_id,
+        "overrides": sorted(recipe.overrides or {}),
+    }
+
+
+def _check_detail_schema():
+    # The one validation: to_detail() must keep producing RecipeDetailOut
+    sample = to_detail(models.Recipe(id=0, title="", description="", is_master_recipe=0), 0)
+    fields = getattr(RecipeDetailOut, "model_fields", None) or RecipeDetailOut.__fields__
+    if set(sample) != set(fields):
+        raise RuntimeError(f"to_detail() keys {sorted(sample)} don't match RecipeDetailOut {sorted(fields)}")
+    RecipeDetailOut(**sample)
+
+
+_check_detail_schema()
+
+
+def dumps(content) -> bytes:
+    """JSON-encode response content (dicts, lists, str, int, bool) with orjson."""
+    return orjson.dumps(content)
+
+
+def load_recipes(query: Query) -> List[models.Recipe]:
+    """Run a recipe query with all child collections eagerly loaded."""
+    return query.options(*DETAIL_LOADERS).all()
+
+
+def fetch_details(db: Session, query: Query, user_id: Optional[int] = None, averages: bool = False) -> List[Dict]:
+    """
+    Build a to_detail() row for every recipe matched by `query`.
+
+    Costs one query for the recipes, one per child collection (none with
+    document storage) and one for the caller's ratings and notes
+    (personal_overlay()); when `averages` is set (admin view), the all-user
+    average replaces the caller's rating, at one more query.
+    """
+    recipes = load_recipes(query)
+    if not recipes:
+        return []
+    ids = [r.id for r in recipes]
+    if averages:
+        ratings, my_notes = average_ratings(db, ids), notes.latest(db, user_id, ids)
+    else:
+        _, ratings, my_notes = personal_overlay(db, user_id, ids)
+    return [to_detail(r, ratings.get(r.id, 0), my_notes.get(r.id, NO_NOTES)) for r in recipes]
+
+
+def fetch_detail(db: Session, recipe_id: int) -> Optional[models.Recipe]:
+    return (
+        db.query(models.Recipe)
+          .options(*DETAIL_LOADERS)
+          .filter(models.Recipe.id == recipe_id)
+          .first()
+    )
+
+
+def _personal_prefix(rating: int, summary: NoteSummary) -> bytes:
+    # '{"userRating":..,"noteCount":..,' : opens a serialized catalog entry
+    return orjson.dumps(_personal(rating, summary))[:-1] + b","
+
+
+# Each pre-serialized catalog entry starts with the caller-specific fields
+# at their defaults; a caller's own values replace exactly these bytes.
+_DEFAULT_PREFIX = _personal_prefix(0, NO_NOTES)
+_PERSONAL_FIELDS = frozenset(_personal(0, NO_NOTES))
+
+
+def _serialize_item(detail: Dict) -> bytes:
+    shared = {k: v for k, v in detail.items() if k not in _PERSONAL_FIELDS}
+    return _DEFAULT_PREFIX + orjson.dumps(shared)[1:]
+
+
+def catalog_view(db: Session, equipment: Optional[List[str]] = None) -> Dict:
+    """
+    The master catalog (optionally filtered by equipment), serialized once
+    into a single JSON array with every userRating set to 0 and no notes.
+
+    `spans` holds each recipe's byte range within `body`; render() splices
+    the caller's ratings and notes into those ranges, so a request costs
+    one slice per recipe the caller has rated or annotated plus a copy of
+    the bytes, never a per-field re-serialization of the catalog.
+    """
+    recipes = load_recipes(with_equipment(master_recipes(db), equipment))
+    logger.info("Building catalog view (equipment=%s): %d recipes", equipment, len(recipes))
+    parts, spans, pos = [], [], 1
+    for r in recipes:
+        rows.debug("Serializing catalog recipe %s", r.id)
+        item = _serialize_item(to_detail(r, 0))
+        spans.append((pos, pos + len(item)))
+        parts.append(item)
+        pos += len(item) + 1
+    ids = [r.id for r in recipes]
+    return {
+        "body": b"[" + b",".join(parts) + b"]",
+        "spans": spans,
+        "ids": ids,
+        "index": {recipe_id: i for i, recipe_id in enumerate(ids)},
+    }
+
+
+def page_of(view: Dict, after: Optional[int], limit: Optional[int]) -> Tuple[int, int, Optional[int]]:
+    """keyset + split_page over a catalog view: (start, stop, next cursor)."""
+    start = bisect_right(view["ids"], after) if after is not None else 0
+    total = len(view["ids"])
+    if limit is None or start + limit >= total:
+        return start, total, None
+    stop = start + limit
+    return start, stop, view["ids"][stop - 1]
+
+
+def _personalized(
+    view: Dict, ratings: Dict[int, int], my_notes: Dict[int, NoteSummary], start: int, stop: int
+) -> Dict[int, bytes]:
+    """Catalog position -> entry prefix, for recipes in [start, stop) the caller rated or noted."""
+    index = view["index"]
+    positions = set()
+    for recipe_id in set(ratings) | set(my_notes):
+        i = index.get(recipe_id)
+        if i is not None and start <= i < stop:
+            positions.add(i)
+    ids = view["ids"]
+    out = {}
+    for i in positions:
+        rating, summary = ratings.get(ids[i], 0), my_notes.get(ids[i], NO_NOTES)
+        if rating or summary[0]:
+            out[i] = _personal_prefix(rating, summary)
+    return out
+
+
+def _splice(view: Dict, personal: Dict[int, bytes], start: int, stop: int) -> bytes:
+    """The recipes in [start, stop) as comma-separated JSON objects."""
+    body, spans = view["body"], view["spans"]
+    out, cur = [], spans[start][0]
+    for i in sorted(personal):
+        if start <= i < stop:
+            out.append(body[cur:spans[i][0]])
+            out.append(personal[i])
+            cur = spans[i][0] + len(_DEFAULT_PREFIX)
+    out.append(body[cur:spans[stop - 1][1]])
+    return b"".join(out)
+
+
+def render(view: Dict, ratings: Dict[int, int], my_notes: Dict[int, NoteSummary], start: int, stop: int) -> bytes:
+    """JSON array of the recipes in [start, stop) with the caller's ratings and notes."""
+    if start >= stop:
+        return b"[]"
+    return b"[" + _splice(view, _personalized(view, ratings, my_notes, start, stop), start, stop) + b"]"
+
+
+def render_one(view: Dict, ratings: Dict[int, int], my_notes: Dict[int, NoteSummary], recipe_id: int) -> Optional[bytes]:
+    i = view["index"].get(recipe_id)
+    if i is None:
+        return None
+    return _splice(view, _personalized(view, ratings, my_notes, i, i + 1), i, i + 1)
+
+
+def render_ndjson(
+    view: Dict, ratings: Dict[int, int], my_notes: Dict[int, NoteSummary], start: int, stop: int
+) -> Iterator[bytes]:
+    personal = _personalized(view, ratings, my_notes, start, stop)
+    for i in range(start, stop):
+        mine = {i: personal[i]} if i in personal else {}
+        yield _splice(view, mine, i, i + 1) + b"\n"
+
+
+def iter_details(db: Session, query: Query, user_id: int, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Yield to_detail() rows one at a time from a server-side cursor.
+
+    Recipes are fetched `batch_size` rows at a time (child collections are
+    selectin-loaded per batch), so memory stays flat however many rows match.
+    """
+    _, ratings, my_notes = personal_overlay(db, user_id)
+    for r in query.options(*DETAIL_LOADERS).yield_per(batch_size):
+        rows.debug("Streaming recipe %s", r.id)
+        yield to_detail(r, ratings.get(r.id, 0), my_notes.get(r.id, NO_NOTES))
+
+
+def to_ndjson(details: Iterable[Dict]) -> Iterator[bytes]:
+    for d in details:
+        yield orjson.dumps(d, option=orjson.OPT_APPEND_NEWLINE)
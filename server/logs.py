@@ -0,0 +1,85 @@
+# server/logs.py
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Root level, and per-logger overrides as "name=LEVEL,name=LEVEL", e.g.
+#   LOG_LEVELS="listing=DEBUG,sqlalchemy.engine=INFO"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+# Per-row debug events (one per recipe processed) are logged 1 in N times
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)-5.5s [%(name)s] %(message)s"
+
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves all formatting to the listener thread.
+
+    The stock prepare() renders the message and traceback on the calling
+    thread; here the record goes onto the queue as-is, so a request only
+    pays for building the LogRecord.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    Route all logging through a queue drained by a background thread, which
+    does the formatting and the (blocking) write to stderr. Safe to call
+    more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [_DeferredQueueHandler(records)]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+class RowSampler:
+    """
+    Debug logging for per-row events, emitted for one row in `every`.
+
+    The level check comes first, so with DEBUG off a call costs one method
+    call and no formatting.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = LOG_SAMPLE_EVERY):
+        self.logger = logger
+        self.every = max(every, 1)
+        self._count = itertools.count()
+
+    def debug(self, msg: str, *args):
+        if self.logger.isEnabledFor(logging.DEBUG) and next(self._count) % self.every == 0:
+            self.logger.debug(msg + " (sampled 1/%d)", *args, self.every)
@@ -1,13 +1,59 @@
 # server/main.py
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Callable, Iterator, List, Optional
+import logging
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+# First: database loads server/.env, which the modules below read settings from
+from database import (
+    SessionLocal, AsyncSessionLocal, engine, async_engine, pool_stats,
+    WRITER, replicas, read_session, async_read_session,
+)
 import models
-from database import SessionLocal
+import bulk
+import compression
+import listing
+import metrics
+import notes
+import passwords
+import ratings
+import storage
+import writes
+from auth import Principal, create_access_token, get_principal, require_admin
+from catalog import bump_catalog, catalog, etag
+from dedupe import duplicates
+from recommend import recommender, recommendations
+from logs import setup_logging
+from schemas import (
+    UserCreate,
+    UserLogin,
+    EquipmentOut,
+    EquipmentIn,
+    RecipeCreate,
+    RecipeDetailOut,
+    RecipesOut,
+    RecipeUpdate,
+    RecipePatch,
+    RatingIn,
+    NoteIn,
+    NotesPageOut,
+    BatchChanges,
+    UserRoleOut,
+    ImportReport,
+    RatingAnalyticsOut,
+    ReconcileReport,
+    RecommendationsOut,
+    DuplicatesOut,
+    DuplicatePairsOut,
+)
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Personal Coffee Recipe Assistant API")
 
@@ -19,7 +65,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After"],
+)
+
+# gzip/brotli for JSON bodies; cacheable payloads go through
+# compression.compressed_response and are compressed once per version
+app.add_middleware(compression.CompressionMiddleware)
+
+# Per-route latency and SQL statement counts, served at /metrics
+metrics.instrument(
+    engine, async_engine.sync_engine,
+    *[e for r in replicas.replicas for e in (r.engine, r.async_engine.sync_engine)],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 def get_db():
     db = SessionLocal()
@@ -28,93 +86,131 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    # For `async def` handlers: queries await the driver instead of blocking
+    # the event loop. Sync ORM helpers (listing.*) run through db.run_sync.
+    async with AsyncSessionLocal() as db:
+        yield db
 
-# --- Schemas ---
+# get_db/get_async_db use the primary. Handlers that only read on the
+# caller's behalf take a read session instead: a replica, unless the caller
+# committed a write through a write session in the last REPLICA_STICKY_SECONDS
+# (see database.ReplicaSet). Without DATABASE_REPLICA_URLS all three are the primary.
 
-class UserCreate(BaseModel):
-    Username: str
-    Password: str
-    Utensils: List[str] = []
+def get_read_db(user: Principal = Depends(get_principal)):
+    db = read_session(user.id)
+    try:
+        yield db
+    finally:
+        db.close()
 
-class UserLogin(BaseModel):
-    Username: str
-    Password: str
+async def get_async_read_db(user: Principal = Depends(get_principal)):
+    async with async_read_session(user.id) as db:
+        yield db
 
-class EquipmentOut(BaseModel):
-    equipment: List[str]
+def get_write_db(user: Principal = Depends(get_principal)):
+    db = SessionLocal(info={WRITER: user.id})
+    try:
+        yield db
+    finally:
+        db.close()
 
-class EquipmentIn(BaseModel):
-    Utensils: List[str]
+async def get_async_write_db(user: Principal = Depends(get_principal)):
+    async with AsyncSessionLocal(info={WRITER: user.id}) as db:
+        yield db
 
-class RecipeCreate(BaseModel):
-    Title: str
-    Description: str = ""
-    Utensils: List[Dict[str, str]]
-    Recipie: str
-    Ingredients: List[str] = []
+# --- Pagination / streaming helpers ---
 
-class RecipeDetailOut(BaseModel):
-    id: int
-    title: str
-    description: str
-    equipment: List[str]
-    ingredients: List[str]
-    instructions: List[str]
-    userRating: int
-    userNotes: List[str]
-    isMasterRecipe: bool
+def wants_ndjson(request: Request) -> bool:
+    return listing.NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
 
-class RecipesOut(BaseModel):
-    recipes: List[RecipeDetailOut]
+def session_stream(
+    produce: Callable[[Session], Iterator[bytes]], new_session: Callable[[], Session] = SessionLocal
+) -> Iterator[bytes]:
+    # The generator owns its session: the request-scoped one from get_db
+    # can be closed before the body has finished streaming.
+    db = new_session()
+    try:
+        yield from produce(db)
+    finally:
+        db.close()
 
-class RecipeUpdate(BaseModel):
-    Title: str
-    Description: str = ""
-    Utensils: List[Dict[str, str]]
-    Recipie: str
-    Ingredients: List[str] = []
+def stream_recipes(build_query: Callable, user_id: int) -> StreamingResponse:
+    body = session_stream(
+        lambda db: listing.to_ndjson(listing.iter_details(db, build_query(db), user_id)),
+        lambda: read_session(user_id),
+    )
+    return StreamingResponse(body, media_type=listing.NDJSON_MEDIA_TYPE)
 
-class RatingIn(BaseModel):
-    rating: int
+def json_response(content, headers: Optional[dict] = None) -> Response:
+    # Rows from listing.to_detail() are already shaped like the response
+    # model; returning the encoded bytes skips FastAPI's re-validation.
+    return Response(listing.dumps(content), media_type="application/json", headers=headers)
 
-class NoteIn(BaseModel):
-    note: str
+def set_next_cursor(response: Response, next_after: Optional[int]):
+    if next_after is not None:
+        response.headers["X-Next-After"] = str(next_after)
 
-class UserRoleOut(BaseModel):
-    role: str
 
+# --- Master catalog cache ---
 
-# --- Auth ----------
+def master_catalog(db: Session, version: int, equipment: Optional[List[str]] = None) -> dict:
+    """
+    The cached catalog view, rebuilt from `db` once the shared version
+    passes `version`. `version` must have been read from `db` already
+    (personal_overlay() does): the rows read after it are at least as new,
+    so a view is never tagged newer than what it holds.
+    """
+    key = tuple(sorted(set(equipment))) if equipment else ()
 
-def check_admin(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user or user.role != "admin":
-        raise HTTPException(403, "Admin access required")
-    return user
+    def build():
+        view = listing.catalog_view(db, equipment)
+        view["version"] = version
+        return view
+    return catalog.get_or_build(key, version, build)
+
+def not_modified(request: Request, tag: str) -> bool:
+    return tag in request.headers.get("if-none-match", "")
+
+
+# --- Auth ----------
 
 @app.post("/users", status_code=201)
-def create_user(payload: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter_by(username=payload.Username).first()
+async def create_user(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(models.User.id).filter_by(username=payload.Username))
     if existing_user:
         raise HTTPException(400, "Username already exists")
     user = models.User(
         username=payload.Username,
-        hashed_password=payload.Password,
+        hashed_password=await passwords.hash_password(payload.Password),
         role="user",
     )
     db.add(user)
-    db.flush()
+    await db.flush()
     for u in payload.Utensils:
         db.add(models.UserUtensil(user_id=user.id, utensil=u))
-    db.commit()
+    await db.commit()
     return {"status": "ok"}
 
 @app.post("/login")
-def login(payload: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=payload.Username).first()
-    if not user or user.hashed_password != payload.Password:
+async def login(payload: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).filter_by(username=payload.Username))
+    if not user:
         raise HTTPException(400, "Invalid credentials")
-    return {"status": "ok"}
+    ok, new_hash = await passwords.verify_password(payload.Password, user.hashed_password)
+    if not ok:
+        raise HTTPException(400, "Invalid credentials")
+    if new_hash:
+        # Plaintext or outdated-cost hash: store the upgraded one
+        user.hashed_password = new_hash
+        await db.commit()
+    # Clients send this back as "Authorization: Bearer <token>"; the id and
+    # role it carries spare every later request its user lookup.
+    return {
+        "status": "ok",
+        "access_token": create_access_token(user),
+        "token_type": "bearer",
+    }
 
 
 # --- Equipment ------
@@ -128,148 +224,127 @@ ALL_EQUIPMENT = [
     "Moka Pot"
 ]
 
+EQUIPMENT_BODY = listing.dumps({"equipment": ALL_EQUIPMENT})
+
 @app.get("/equipment", response_model=EquipmentOut)
-def get_all_equipment():
-    return {"equipment": ALL_EQUIPMENT}
+def get_all_equipment(request: Request):
+    return compression.compressed_response(request, EQUIPMENT_BODY, key="equipment")
+
+def target_user_id(db: Session, user: Principal, username: str) -> int:
+    """
+    The id of the user named in a /users/{username}/... path: the caller
+    themselves, or anyone for an admin.
+    """
+    if user.username == username:
+        return user.id
+    if not user.is_admin:
+        raise HTTPException(403, "Not your account")
+    target = db.query(models.User.id).filter_by(username=username).first()
+    if not target:
+        raise HTTPException(404, "User not found")
+    return target.id
 
 @app.get("/users/{username}/equipment", response_model=EquipmentOut)
-def get_equipment(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-    tools = [u.utensil for u in db.query(models.UserUtensil).filter_by(user_id=user.id)]
+def get_equipment(username: str, user: Principal = Depends(get_principal), db: Session = Depends(get_db)):
+    user_id = target_user_id(db, user, username)
+    tools = [u.utensil for u in db.query(models.UserUtensil).filter_by(user_id=user_id)]
     return {"equipment": tools}
 
 @app.put("/users/{username}/equipment", response_model=EquipmentOut)
-def update_equipment(username: str, payload: EquipmentIn, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-    db.query(models.UserUtensil).filter_by(user_id=user.id).delete()
+def update_equipment(
+    username: str, payload: EquipmentIn, user: Principal = Depends(get_principal), db: Session = Depends(get_db)
+):
+    user_id = target_user_id(db, user, username)
+    db.query(models.UserUtensil).filter_by(user_id=user_id).delete()
     for u in payload.Utensils:
-        db.add(models.UserUtensil(user_id=user.id, utensil=u))
+        db.add(models.UserUtensil(user_id=user_id, utensil=u))
     db.commit()
     return {"equipment": payload.Utensils}
 
 
+# --- Recommendations ---
+
+@app.get("/users/{name}/recommendations", response_model=RecommendationsOut)
+def get_recommendations(
+    name: str,
+    limit: int = Query(10, ge=1, le=50),
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Master recipes the user hasn't rated, ranked by the ratings of recipes
+    similar to ones they rated (item-item collaborative filtering), topped
+    up with popular recipes for users with few ratings.
+    """
+    return {"recipes": recommendations(db, target_user_id(db, user, name), limit)}
+
+
 # --- Master Recipes (public defaults) ---
 
 @app.get("/master/recipies", response_model=List[RecipeDetailOut])
 async def get_master_recipes(
-    username: str = Query(...),
+    request: Request,
+    user: Principal = Depends(get_principal),
     equipment: List[str] = Query(None), 
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=listing.MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None),
+    reads: AsyncSession = Depends(get_async_read_db),
 ):
+    """
+    Master recipes ordered by id. With `limit`, returns one page of recipes
+    with id > `after`; the X-Next-After header carries the cursor for the
+    next page. Send "Accept: application/x-ndjson" to stream one recipe per
+    line instead.
+
+    Served from the in-process catalog cache, pre-serialized once per
+    catalog version with only the caller's ratings spliced in per request.
+    The ETag changes when the catalog or the caller's ratings do, and
+    If-None-Match gets a 304.
+
+    Everything comes from the read session, the catalog version first: a
+    replica still behind the write that moved the version reports the old
+    version and builds a view that is only stored under it.
+    """
     try:
-        print("Fetching master recipes...")
-        print("Database session:", db)
-        
-        # First check if the Recipe model exists
-        try:
-            recipe_count = db.query(models.Recipe).count()
-            print(f"Total recipes in database: {recipe_count}")
-        except Exception as e:
-            print(f"Error counting recipes: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            raise HTTPException(
-                status_code=500,
-                detail=f"Database error: {str(e)}"
-            )
+        logger.info("Fetching master recipes for user: %s", user.username)
 
-        # Get user
-        user = db.query(models.User).filter_by(username=username).first()
-        if not user:
-            raise HTTPException(404, "User not found")
-
-        # Get all master recipes with error handling
-        try:
-            recipes = db.query(models.Recipe).filter(models.Recipe.is_master_recipe == 1).all()
-            print(f"Found {len(recipes)} master recipes")
-        except Exception as e:
-            print(f"Error querying master recipes: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error querying master recipes: {str(e)}"
-            )
-        
-        if not recipes:
-            print("No master recipes found")
-            return []
-            
         # Filter recipes based on equipment
         if equipment:
-            print(f"Filtering recipes by equipment: {equipment}")
-            filtered_recipes = []
-            for recipe in recipes:
-                try:
-                    # Check if recipe has utensils relationship
-                    if not hasattr(recipe, 'utensils'):
-                        print(f"Recipe {recipe.id} has no utensils relationship")
-                        continue
-                        
-                    recipe_equipment = [ru.utensil for ru in recipe.utensils]
-                    print(f"Recipe {recipe.id} equipment: {recipe_equipment}")
-                    
-                    if any(e in recipe_equipment for e in equipment):
-                        # Get only this user's rating
-                        user_rating = db.query(models.Rating).filter_by(recipe_id=recipe.id, user_id=user.id).first()
-                        rating = user_rating.rating if user_rating else 0
-                        notes = [nt.content for nt in recipe.notes] if hasattr(recipe, 'notes') else []
-                        
-                        filtered_recipes.append(
-                            RecipeDetailOut(
-                                id=recipe.id,
-                                title=recipe.title,
-                                description=recipe.description or "",
-                                equipment=recipe_equipment,
-                                ingredients=[ing.text for ing in recipe.ingredients] if hasattr(recipe, 'ingredients') else [],
-                                instructions=[inst.step for inst in recipe.instructions] if hasattr(recipe, 'instructions') else [],
-                                userRating=rating,
-                                userNotes=notes,
-                                isMasterRecipe=True
-                            )
-                        )
-                except Exception as e:
-                    print(f"Error processing recipe {recipe.id}: {str(e)}")
-                    continue
-            print(f"Returning {len(filtered_recipes)} filtered recipes")
-            return filtered_recipes
-            
-        # If no equipment filter, return all master recipes
-        print("No equipment filter, returning all master recipes")
-        result = []
-        for recipe in recipes:
-            try:
-                # Get only this user's rating
-                user_rating = db.query(models.Rating).filter_by(recipe_id=recipe.id, user_id=user.id).first()
-                rating = user_rating.rating if user_rating else 0
-                notes = [nt.content for nt in recipe.notes] if hasattr(recipe, 'notes') else []
-                
-                result.append(
-                    RecipeDetailOut(
-                        id=recipe.id,
-                        title=recipe.title,
-                        description=recipe.description or "",
-                        equipment=[ru.utensil for ru in recipe.utensils] if hasattr(recipe, 'utensils') else [],
-                        ingredients=[ing.text for ing in recipe.ingredients] if hasattr(recipe, 'ingredients') else [],
-                        instructions=[inst.step for inst in recipe.instructions] if hasattr(recipe, 'instructions') else [],
-                        userRating=rating,
-                        userNotes=notes,
-                        isMasterRecipe=True
-                    )
-                )
-            except Exception as e:
-                print(f"Error processing recipe {recipe.id}: {str(e)}")
-                continue
-        print(f"Returning {len(result)} recipes")
-        return result
+            logger.debug("Filtering recipes by equipment: %s", equipment)
+        # The shared catalog version the cached view is checked against, and
+        # only this user's ratings and newest notes, in one query
+        def read(s: Session):
+            version, my_ratings, my_notes = listing.personal_overlay(s, user.id)
+            return master_catalog(s, version, equipment), my_ratings, my_notes
+        view, my_ratings, my_notes = await reads.run_sync(read)
+        tag = etag(view["version"], my_ratings, my_notes)
+        if not_modified(request, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+
+        # The shared, pre-serialized catalog with this user's ratings and notes spliced in
+        start, stop, next_after = listing.page_of(view, after, limit)
+        logger.info("Returning %d recipes", stop - start)
+        if wants_ndjson(request):
+            return StreamingResponse(
+                listing.render_ndjson(view, my_ratings, my_notes, start, stop),
+                media_type=listing.NDJSON_MEDIA_TYPE,
+                headers={"ETag": tag},
+            )
+        # The tag covers the catalog version and the caller's ratings and
+        # notes, so the page is compressed once until one of them changes
+        filtered = tuple(sorted(set(equipment))) if equipment else ()
+        response = compression.compressed_response(
+            request,
+            listing.render(view, my_ratings, my_notes, start, stop),
+            key=("master", filtered, tag, start, stop),
+            headers={"ETag": tag},
+        )
+        set_next_cursor(response, next_after)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_master_recipes: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in get_master_recipes")
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching master recipes: {str(e)}"
@@ -280,82 +355,41 @@ async def get_master_recipes(
 
 @app.get("/recipies", response_model=RecipesOut)
 def list_recipes(
-    username: str = Query(...),
+    request: Request,
+    user: Principal = Depends(get_principal),
     equipment: List[str] = Query(None),
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=listing.MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None),
+    db: Session = Depends(get_read_db),
 ):
+    """
+    The caller's personal recipes, paginated and streamable the same way
+    as /master/recipies.
+    """
     try:
-        print(f"Fetching personal recipes for user: {username}")
-        
-        user = db.query(models.User).filter_by(username=username).first()
-        if not user:
-            raise HTTPException(404, "User not found")
-        print(f"Found user with ID: {user.id}")
-
-        # Get personal recipes for this user
-        raw = (
-            db.query(models.Recipe)
-              .filter(
-                  models.Recipe.is_master_recipe == 0,  # Only personal recipes
-                  models.Recipe.user_id == user.id,     # Only this user's recipes
-              )
-              .all()
-        )
-        print(f"Found {len(raw)} personal recipes for user")
+        logger.info("Fetching personal recipes for user: %s", user.username)
 
-        # Filter by equipment if provided
+        # Get personal recipes for this user, filtered by equipment if provided
         if equipment:
-            print(f"Filtering recipes by equipment: {equipment}")
-            filtered = []
-            for r in raw:
-                try:
-                    recipe_equipment = [ru.utensil for ru in r.utensils] if hasattr(r, 'utensils') else []
-                    print(f"Recipe {r.id} equipment: {recipe_equipment}")
-                    if any(e in recipe_equipment for e in equipment):
-                        filtered.append(r)
-                except Exception as e:
-                    print(f"Error checking equipment for recipe {r.id}: {str(e)}")
-                    continue
-            raw = filtered
-            print(f"After equipment filter: {len(raw)} recipes")
-
-        out: List[RecipeDetailOut] = []
-        for r in raw:
-            try:
-                # Get only this user's rating
-                user_rating = db.query(models.Rating).filter_by(recipe_id=r.id, user_id=user.id).first()
-                rating = user_rating.rating if user_rating else 0
-                notes = [nt.content for nt in r.notes] if hasattr(r, 'notes') else []
-
-                recipe_equipment = [ru.utensil for ru in r.utensils] if hasattr(r, 'utensils') else []
-                print(f"Processing recipe {r.id} with equipment: {recipe_equipment}")
-
-                out.append(
-                    RecipeDetailOut(
-                        id=r.id,
-                        title=r.title,
-                        description=r.description or "",
-                        equipment=recipe_equipment,
-                        ingredients=[ing.text for ing in r.ingredients] if hasattr(r, 'ingredients') else [],
-                        instructions=[inst.step for inst in r.instructions] if hasattr(r, 'instructions') else [],
-                        userRating=rating,
-                        userNotes=notes,
-                        isMasterRecipe=False
-                    )
-                )
-            except Exception as e:
-                print(f"Error processing recipe {r.id}: {str(e)}")
-                continue
-
-        print(f"Returning {len(out)} recipes")
-        return {"recipes": out}
+            logger.debug("Filtering recipes by equipment: %s", equipment)
+        def build(s: Session):
+            return listing.with_equipment(listing.personal_recipes(s, user.id), equipment)
+
+        if wants_ndjson(request):
+            return stream_recipes(lambda s: listing.keyset(build(s), after, limit, lookahead=False), user.id)
+
+        query = listing.keyset(build(db), after, limit)
+        out, next_after = listing.split_page(listing.fetch_details(db, query, user.id), limit)
+        response = json_response({"recipes": out})
+        set_next_cursor(response, next_after)
+
+        logger.info("Returning %d recipes", len(out))
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in list_recipes: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in list_recipes")
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching recipes: {str(e)}"
@@ -364,112 +398,96 @@ def list_recipes(
 
 @app.get("/recipie/{id}", response_model=RecipeDetailOut)
 def get_recipe(
+    request: Request,
     id: int,
-    username: str = Query(...),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_principal),
+    reads: Session = Depends(get_read_db),
 ):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
+    # The catalog version and this user's rating and notes, in one query
+    version, my_ratings, my_notes = listing.personal_overlay(reads, user.id, [id])
+    # Master recipes come straight from the catalog cache
+    view = master_catalog(reads, version)
+    if id in view["index"]:
+        tag = etag(view["version"], my_ratings, my_notes, str(id))
+        if not_modified(request, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+        return Response(
+            listing.render_one(view, my_ratings, my_notes, id),
+            media_type="application/json",
+            headers={"ETag": tag},
+        )
 
-    r = db.query(models.Recipe).get(id)
+    r = listing.fetch_detail(reads, id)
     if not r:
         raise HTTPException(404, "Recipe not found")
     # allow viewing master or your own
     if r.is_master_recipe == 0 and r.user_id != user.id:
         raise HTTPException(403, "Not your recipe")
 
-    # Get only this user's rating
-    user_rating = db.query(models.Rating).filter_by(recipe_id=id, user_id=user.id).first()
-    rating = user_rating.rating if user_rating else 0
-    notes = [nt.content for nt in r.notes]
-
-    return RecipeDetailOut(
-        id=r.id,
-        title=r.title,
-        description=r.description or "",
-        equipment=[ru.utensil for ru in r.utensils],
-        ingredients=[ing.text for ing in r.ingredients],
-        instructions=[inst.step for inst in r.instructions],
-        userRating=rating,
-        userNotes=notes,
-        isMasterRecipe=bool(r.is_master_recipe),
-    )
+    return json_response(listing.to_detail(r, my_ratings.get(id, 0), my_notes.get(id, listing.NO_NOTES)))
 
 
 @app.post("/recipies", status_code=201)
 def create_recipe(
     payload: RecipeCreate,
-    username: str = Query(...),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_write_db),
 ):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-
-    r = models.Recipe(
-        title=payload.Title,
-        description=payload.Description,
-        user_id=user.id,
-        is_master_recipe=0,
-    )
-    db.add(r)
-    db.flush()
-    for u in payload.Utensils:
-        db.add(models.RecipeUtensil(recipe_id=r.id, utensil=u["Utensil"]))
-    for step in payload.Recipie.split("\n"):
-        db.add(models.RecipeInstruction(recipe_id=r.id, step=step))
-    for ingredient in payload.Ingredients:
-        db.add(models.RecipeIngredient(recipe_id=r.id, text=ingredient))
+    recipe_id = writes.create_recipe(db, payload, user.id, is_master=False)
     db.commit()
-    return {"id": r.id}
+    duplicates.touch(recipe_id)
+    return {"id": recipe_id}
 
 
-@app.put("/recipies/{id}")
-def update_recipe(
-    id: int,
-    payload: RecipeUpdate,
-    username: str = Query(...),
-    db: Session = Depends(get_db),
-):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-
-    r = db.query(models.Recipe).get(id)
+def own_recipe(db: Session, id: int, user: Principal) -> models.Recipe:
+    r = db.get(models.Recipe, id)
     if not r:
         raise HTTPException(404, "Recipe not found")
     if r.is_master_recipe:
         raise HTTPException(403, "Cannot edit master recipes directly.")
     if r.user_id != user.id:
         raise HTTPException(403, "Not your recipe")
+    return r
 
-    r.title = payload.Title
-    r.description = payload.Description
-    db.query(models.RecipeUtensil).filter_by(recipe_id=id).delete()
-    for u in payload.Utensils:
-        db.add(models.RecipeUtensil(recipe_id=id, utensil=u["Utensil"]))
-    db.query(models.RecipeInstruction).filter_by(recipe_id=id).delete()
-    for step in payload.Recipie.split("\n"):
-        db.add(models.RecipeInstruction(recipe_id=id, step=step))
-    db.query(models.RecipeIngredient).filter_by(recipe_id=id).delete()
-    for ingredient in payload.Ingredients:
-        db.add(models.RecipeIngredient(recipe_id=id, text=ingredient))
+
+@app.put("/recipies/{id}")
+def update_recipe(
+    id: int,
+    payload: RecipeUpdate,
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_write_db),
+):
+    writes.apply_changes(db, own_recipe(db, id, user), payload)
     db.commit()
+    duplicates.touch(id)
     return {"status": "ok"}
 
 
+@app.patch("/recipies/{id}")
+def patch_recipe(
+    id: int,
+    payload: RecipePatch,
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_write_db),
+):
+    """
+    Partial update: send only what changed. Child lists are compared
+    position by position and only differing rows are written.
+    """
+    changed = writes.apply_changes(db, own_recipe(db, id, user), payload)
+    db.commit()
+    if {"title", "ingredients", "instructions"} & set(changed):
+        duplicates.touch(id)
+    return {"status": "ok", "changed": changed}
+
+
 @app.delete("/recipies/{id}")
 def delete_recipe(
     id: int,
-    username: str = Query(...),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_write_db),
 ):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-
-    r = db.query(models.Recipe).get(id)
+    r = db.get(models.Recipe, id)
     if not r:
         raise HTTPException(404, "Recipe not found")
     if r.is_master_recipe:
@@ -482,210 +500,148 @@ def delete_recipe(
     db.query(models.RecipeIngredient).filter_by(recipe_id=id).delete()
     db.query(models.Rating).filter_by(recipe_id=id).delete()
     db.query(models.Note).filter_by(recipe_id=id).delete()
+    ratings.forget(db, id)
 
     db.delete(r)
     db.commit()
+    recommender.note_recipe_deleted(id)
+    duplicates.forget(id)
     return {"status": "ok"}
 
 
 @app.post("/recipies/{id}/rating")
-def save_rating(id: int, payload: RatingIn, username: str = Query(...), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-        
-    # Delete any existing ratings for this recipe by this user
-    db.query(models.Rating).filter_by(recipe_id=id, user_id=user.id).delete()
-    # Add the new rating
-    db.add(models.Rating(recipe_id=id, user_id=user.id, rating=payload.rating))
+def save_rating(id: int, payload: RatingIn, user: Principal = Depends(get_principal), db: Session = Depends(get_write_db)):
+    # Insert or overwrite this user's rating in one statement
+    ratings.save(db, user.id, {id: payload.rating})
     db.commit()
+    recommender.note_ratings(user.id, {id: payload.rating})
     return {"status": "ok"}
 
 
-@app.post("/recipies/{id}/notes")
-def add_note(id: int, payload: NoteIn, db: Session = Depends(get_db)):
-    db.add(models.Note(recipe_id=id, content=payload.note))
+def check_note_access(db: Session, recipe_ids, user: Principal):
+    # Notes go on master recipes and the caller's own
+    missing = set(recipe_ids) - notes.visible(db, user.id, recipe_ids)
+    if missing:
+        raise HTTPException(404, f"Recipe {min(missing)} not found")
+
+
+@app.get("/recipies/{id}/notes", response_model=NotesPageOut)
+def get_notes(
+    id: int,
+    limit: int = Query(notes.NOTES_PAGE_SIZE, ge=1, le=notes.MAX_NOTES_PAGE_SIZE),
+    before: Optional[int] = Query(None),
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_read_db),
+):
+    """The caller's notes on a recipe, newest first; pass nextBefore as ?before= for older ones."""
+    page, next_before = notes.page(db, user.id, id, limit, before)
+    return json_response({"notes": page, "count": notes.count(db, user.id, id), "nextBefore": next_before})
+
+
+@app.post("/recipies/{id}/notes", status_code=201)
+def add_note(id: int, payload: NoteIn, user: Principal = Depends(get_principal), db: Session = Depends(get_write_db)):
+    check_note_access(db, [id], user)
+    note_id = notes.add(db, user.id, id, payload.note)
     db.commit()
-    return {"status": "ok"}
+    return {"status": "ok", "id": note_id}
 
 
-@app.delete("/recipies/{id}/notes/{note_index}")
-def delete_note(id: int, note_index: int, db: Session = Depends(get_db)):
-    notes = db.query(models.Note).filter_by(recipe_id=id).all()
-    if note_index < 0 or note_index >= len(notes):
+@app.delete("/recipies/{id}/notes/{note_id}")
+def delete_note(id: int, note_id: int, user: Principal = Depends(get_principal), db: Session = Depends(get_write_db)):
+    if not notes.remove(db, user.id, [(id, note_id)]):
         raise HTTPException(404, "Note not found")
-    db.delete(notes[note_index])
     db.commit()
     return {"status": "ok"}
 
 
+@app.post("/recipies/batch")
+def apply_batch(payload: BatchChanges, user: Principal = Depends(get_principal), db: Session = Depends(get_write_db)):
+    """
+    Many rating and note changes in one request and one transaction: either
+    all of them apply or none do. Later ratings of the same recipe win.
+    """
+    changes = {c.recipeId: c.rating for c in payload.ratings}
+    rated = ratings.save(db, user.id, changes) if changes else 0
+
+    removed = 0
+    if payload.deletedNotes:
+        doomed = {(c.recipeId, c.id) for c in payload.deletedNotes}
+        removed = notes.remove(db, user.id, doomed)
+        if removed != len(doomed):
+            raise HTTPException(404, "Note not found")
+
+    if payload.notes:
+        check_note_access(db, {c.recipeId for c in payload.notes}, user)
+        db.execute(
+            insert(models.Note),
+            [{"recipe_id": c.recipeId, "user_id": user.id, "content": c.note} for c in payload.notes],
+        )
+
+    db.commit()
+    recommender.note_ratings(user.id, changes)
+    return {"status": "ok", "ratings": rated, "notesAdded": len(payload.notes), "notesDeleted": removed}
+
+
 @app.post("/recipies/{id}/clone", status_code=201)
 def clone_recipe(
     id: int,
     payload: RecipeUpdate,
-    username: str = Query(...),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_principal),
+    db: Session = Depends(get_write_db),
 ):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-
-    original = db.query(models.Recipe).get(id)
+    original = db.get(models.Recipe, id, options=storage.loaders())
     if not original:
         raise HTTPException(404, "Recipe not found")
     if original.is_master_recipe == 0:
         raise HTTPException(403, "Can only clone master recipes")
 
-    r = models.Recipe(
-        title=payload.Title,
-        description=payload.Description,
-        is_master_recipe=0,
-        user_id=user.id,
-    )
-    db.add(r)
-    db.flush()
-
-    for u in payload.Utensils:
-        db.add(models.RecipeUtensil(recipe_id=r.id, utensil=u["Utensil"]))
-    for step in payload.Recipie.split("\n"):
-        db.add(models.RecipeInstruction(recipe_id=r.id, step=step))
-    for ingredient in payload.Ingredients:
-        db.add(models.RecipeIngredient(recipe_id=r.id, text=ingredient))
-
+    # Only what the payload changes is stored; the rest is read from the master
+    recipe_id = writes.create_copy(db, original, payload, user.id)
     db.commit()
-    return {"id": r.id}
+    duplicates.touch(recipe_id)
+    return {"id": recipe_id}
 
 
 # --- Admin ---------
 
 @app.get("/admin/recipes", response_model=List[RecipeDetailOut])
-async def get_admin_recipes(username: str = Query(...), db: Session = Depends(get_db)):
+async def get_admin_recipes(user: Principal = Depends(require_admin), db: AsyncSession = Depends(get_async_read_db)):
     try:
-        print(f"Fetching admin recipes for user: {username}")
-        
-        # Verify user exists and is admin
-        try:
-            user = db.query(models.User).filter_by(username=username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            if user.role != "admin":
-                raise HTTPException(status_code=403, detail="Admin access required")
-            print(f"User verified as admin: {username}")
-        except Exception as e:
-            print(f"Error verifying user: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            raise
-            
-        # Get only master recipes
-        try:
-            recipes = db.query(models.Recipe).filter(models.Recipe.is_master_recipe == 1).all()
-            print(f"Found {len(recipes)} master recipes")
-        except Exception as e:
-            print(f"Error querying recipes: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error querying recipes: {str(e)}"
-            )
-        
-        result = []
-        for recipe in recipes:
-            try:
-                # Get recipe details
-                ratings = [rt.rating for rt in recipe.ratings] if hasattr(recipe, 'ratings') else []
-                notes = [nt.content for nt in recipe.notes] if hasattr(recipe, 'notes') else []
-                avg = int(sum(ratings) / len(ratings)) if ratings else 0
-                
-                result.append(
-                    RecipeDetailOut(
-                        id=recipe.id,
-                        title=recipe.title,
-                        description=recipe.description or "",
-                        equipment=[ru.utensil for ru in recipe.utensils] if hasattr(recipe, 'utensils') else [],
-                        ingredients=[ing.text for ing in recipe.ingredients] if hasattr(recipe, 'ingredients') else [],
-                        instructions=[inst.step for inst in recipe.instructions] if hasattr(recipe, 'instructions') else [],
-                        userRating=avg,
-                        userNotes=notes,
-                        isMasterRecipe=True
-                    )
-                )
-            except Exception as e:
-                print(f"Error processing recipe {recipe.id}: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-                continue
-                
-        print(f"Returning {len(result)} master recipes")
-        return result
+        logger.info("Fetching admin recipes for user: %s", user.username)
+
+        # Master recipes with the average rating across all users
+        result = await db.run_sync(
+            lambda s: listing.fetch_details(s, listing.master_recipes(s), user.id, averages=True)
+        )
+        logger.info("Returning %d master recipes", len(result))
+        return json_response(result)
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_admin_recipes: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in get_admin_recipes")
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching admin recipes: {str(e)}"
         )
 
 @app.post("/admin/recipes", status_code=201)
-def admin_create(payload: RecipeCreate, username: str = Query(...), db: Session = Depends(get_db)):
+def admin_create(payload: RecipeCreate, user: Principal = Depends(require_admin), db: Session = Depends(get_write_db)):
     try:
-        print(f"Creating master recipe for admin user: {username}")
-        
-        # Verify user exists and is admin
-        try:
-            user = db.query(models.User).filter_by(username=username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            if user.role != "admin":
-                raise HTTPException(status_code=403, detail="Admin access required")
-            print(f"User verified as admin: {username}")
-        except Exception as e:
-            print(f"Error verifying user: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            raise
+        logger.info("Creating master recipe for admin user: %s", user.username)
 
         # Create the recipe
         try:
-            print(f"Creating recipe with title: {payload.Title}")
-            r = models.Recipe(
-                title=payload.Title,
-                description=payload.Description,
-                is_master_recipe=1,
-                user_id=user.id  # Add user_id for master recipes
-            )
-            db.add(r)
-            db.flush()
-            print(f"Created recipe with ID: {r.id}")
-
-            # Add utensils
-            print(f"Adding utensils: {payload.Utensils}")
-            for u in payload.Utensils:
-                db.add(models.RecipeUtensil(recipe_id=r.id, utensil=u["Utensil"]))
-            
-            # Add instructions
-            print(f"Adding instructions from: {payload.Recipie}")
-            for step in payload.Recipie.split("\n"):
-                db.add(models.RecipeInstruction(recipe_id=r.id, step=step))
-            
-            # Add ingredients
-            print(f"Adding ingredients: {payload.Ingredients}")
-            for ingredient in payload.Ingredients:
-                db.add(models.RecipeIngredient(recipe_id=r.id, text=ingredient))
-            
+            logger.debug("Creating recipe with title: %s", payload.Title)
+            recipe_id = writes.create_recipe(db, payload, user.id, is_master=True)
+            bump_catalog(db)
             db.commit()
-            print(f"Successfully created master recipe with ID: {r.id}")
-            return {"id": r.id}
-            
+            duplicates.touch(recipe_id)
+            logger.info("Created master recipe with ID: %s", recipe_id)
+            return {"id": recipe_id}
+
         except Exception as e:
-            print(f"Error creating recipe: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception("Error creating recipe")
             db.rollback()
             raise HTTPException(
                 status_code=500,
@@ -695,48 +651,146 @@ def admin_create(payload: RecipeCreate, username: str = Query(...), db: Session
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in admin_create: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in admin_create")
         raise HTTPException(
             status_code=500,
             detail=f"Error creating master recipe: {str(e)}"
         )
 
+@app.post("/admin/recipes/import", response_model=ImportReport)
+async def admin_import(request: Request, user: Principal = Depends(require_admin), db: AsyncSession = Depends(get_async_write_db)):
+    """
+    Bulk-load master recipes from the request body, streamed as NDJSON
+    (default) or CSV (Content-Type: text/csv), in the format
+    /admin/recipes/export produces. Bad rows are reported, not fatal.
+    """
+    logger.info("Bulk import of master recipes by admin user: %s", user.username)
+    if request.headers.get("content-type", "").startswith(bulk.CSV_MEDIA_TYPE):
+        parsed = bulk.parse_csv(request.stream())
+    else:
+        parsed = bulk.parse_ndjson(request.stream())
+    # Each committed chunk moves the catalog version on
+    return await bulk.import_recipes(db, parsed, user.id)
+
+@app.get("/admin/recipes/export")
+def admin_export(format: str = Query("ndjson"), user: Principal = Depends(require_admin)):
+    """Stream every master recipe as NDJSON or CSV (?format=csv)."""
+    if format == "csv":
+        return StreamingResponse(
+            session_stream(bulk.export_csv, lambda: read_session(user.id)),
+            media_type=bulk.CSV_MEDIA_TYPE,
+            headers={"Content-Disposition": 'attachment; filename="master-recipes.csv"'},
+        )
+    if format != "ndjson":
+        raise HTTPException(400, "format must be ndjson or csv")
+    return StreamingResponse(
+        session_stream(bulk.export_ndjson, lambda: read_session(user.id)), media_type=listing.NDJSON_MEDIA_TYPE
+    )
+
 @app.put("/admin/recipes/{id}")
-def admin_update(id: int, payload: RecipeUpdate, username: str = Query(...), db: Session = Depends(get_db)):
-    check_admin(username, db)
-    r = db.query(models.Recipe).get(id)
+def admin_update(id: int, payload: RecipeUpdate, user: Principal = Depends(require_admin), db: Session = Depends(get_write_db)):
+    r = db.get(models.Recipe, id)
     if not r:
         raise HTTPException(404, "Recipe not found")
-    r.title = payload.Title
-    r.description = payload.Description
+    if r.parent_id is not None:
+        # A master reads nothing from another recipe: write out what the copy inherits first
+        writes.materialize(db, r)
     r.is_master_recipe = 1
-    db.query(models.RecipeUtensil).filter_by(recipe_id=r.id).delete()
-    for u in payload.Utensils:
-        db.add(models.RecipeUtensil(recipe_id=r.id, utensil=u["Utensil"]))
-    db.query(models.RecipeInstruction).filter_by(recipe_id=r.id).delete()
-    for step in payload.Recipie.split("\n"):
-        db.add(models.RecipeInstruction(recipe_id=r.id, step=step))
-    db.query(models.RecipeIngredient).filter_by(recipe_id=r.id).delete()
-    for ingredient in payload.Ingredients:
-        db.add(models.RecipeIngredient(recipe_id=r.id, text=ingredient))
+    writes.apply_changes(db, r, payload)
+    bump_catalog(db)
     db.commit()
+    duplicates.touch(id)
+    for copy_id in writes.copy_ids(db, id):
+        duplicates.touch(copy_id)  # copies that inherit the changed fields
     return {"status": "ok"}
 
 @app.delete("/admin/recipes/{id}")
-def admin_delete(id: int, username: str = Query(...), db: Session = Depends(get_db)):
-    check_admin(username, db)
-    r = db.query(models.Recipe).get(id)
+def admin_delete(id: int, user: Principal = Depends(require_admin), db: Session = Depends(get_write_db)):
+    r = db.get(models.Recipe, id)
     if not r:
         raise HTTPException(404, "Recipe not found")
+    ratings.forget(db, r.id)
+    writes.detach_copies(db, r)
     db.delete(r)
+    bump_catalog(db)
     db.commit()
+    recommender.note_recipe_deleted(id)
+    duplicates.forget(id)
     return {"status": "ok"}
 
+@app.get("/admin/ratings/analytics", response_model=RatingAnalyticsOut)
+def get_rating_analytics(
+    limit: int = Query(10, ge=1, le=100),
+    min_ratings: int = Query(1, ge=1),
+    user: Principal = Depends(require_admin),
+    db: Session = Depends(get_read_db),
+):
+    """Catalog-wide averages and distribution, with the top/bottom rated master recipes."""
+    return ratings.analytics(db, limit=limit, min_ratings=min_ratings)
+
+@app.post("/admin/ratings/reconcile", response_model=ReconcileReport)
+def reconcile_ratings(user: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    """Recompute the rating aggregates from scratch and repair any drift."""
+    return ratings.reconcile(db)
+
+@app.get("/admin/recipes/duplicates", response_model=DuplicatePairsOut)
+def get_all_duplicates(
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0),
+    masterOnly: bool = False,
+    user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """
+    Likely duplicate recipe pairs across the whole catalog (or just the
+    master recipes), most similar first, found through the MinHash/LSH
+    index rather than by comparing every pair.
+    """
+    return {"pairs": duplicates.all_duplicates(db, threshold, master_only=masterOnly)}
+
+@app.get("/admin/recipes/{id}/duplicates", response_model=DuplicatesOut)
+def get_duplicates(
+    id: int,
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0),
+    user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    found = duplicates.duplicates_of(db, id, threshold)
+    if found is None:
+        raise HTTPException(404, "Recipe not found")
+    return {"duplicates": found}
+
+@app.get("/admin/duplicates/stats")
+def get_duplicate_index_stats(user: Principal = Depends(require_admin)):
+    return duplicates.stats()
+
+@app.get("/admin/recommendations/stats")
+def get_recommender_stats(user: Principal = Depends(require_admin)):
+    return recommender.stats()
+
+@app.get("/admin/catalog/stats")
+def get_catalog_stats(user: Principal = Depends(require_admin)):
+    return catalog.stats()
+
+@app.get("/admin/compression/stats")
+def get_compression_stats(user: Principal = Depends(require_admin)):
+    return compression.compressed.stats()
+
+@app.get("/admin/db/pool")
+def get_pool_stats(user: Principal = Depends(require_admin)):
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine), "readRouting": replicas.stats()}
+
+@app.get("/admin/passwords/stats")
+def get_password_stats(user: Principal = Depends(require_admin)):
+    return passwords.pool.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape target; numbers are per worker process."""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.PROMETHEUS_MEDIA_TYPE)
+
 @app.get("/users/{username}/role", response_model=UserRoleOut)
-def get_user_role(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-    return {"role": user.role}
+def get_user_role(username: str, user: Principal = Depends(get_principal), db: Session = Depends(get_db)):
+    if user.username == username:
+        return {"role": user.role}
+    target = db.get(models.User, target_user_id(db, user, username))
+    return {"role": target.role}
@@ -0,0 +1,295 @@
+# server/metrics.py
+
+import bisect
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Histogram bucket upper bounds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Requests that matched no route are counted under one label, so stray URLs
+# can't grow the series count without bound
+UNMATCHED_ROUTE = "unmatched"
+
+
+class QueryStats:
+    """SQL work done on behalf of one request (or one statement_budget block)."""
+
+    __slots__ = ("statements", "seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+# Set for the duration of a request. Starlette copies the context into the
+# thread running a sync handler and SQLAlchemy's async engine keeps it across
+# its greenlets, so the engine hooks below see it wherever the query runs.
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# Open statement_budget blocks. These see every statement in the process:
+# a test client may run the app on another thread, outside the caller's context.
+_budgets: List[QueryStats] = []
+_budgets_lock = threading.Lock()
+
+# conn.info key for the start times of statements in flight on a connection
+_STARTED = "metrics_started"
+
+
+def _targets() -> List[QueryStats]:
+    stats = _current.get()
+    return ([stats] if stats is not None else []) + _budgets
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy that counts the rows fetched through it."""
+
+    def __init__(self, cursor, targets: List[QueryStats]):
+        self._cursor = cursor
+        self._targets = targets
+
+    def _count(self, n: int):
+        for stats in self._targets:
+            stats.rows += n
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._count(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _finished(conn) -> List[QueryStats]:
+    """Charge the statement that just ended on `conn` to everyone watching."""
+    started = conn.info.get(_STARTED)
+    targets = _targets()
+    if not started or not targets:
+        return []
+    elapsed = time.perf_counter() - started.pop()
+    for stats in targets:
+        stats.statements += 1
+        stats.seconds += elapsed
+    return targets
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None or _budgets:
+        conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    targets = _finished(conn)
+    # The result object is built from context.cursor after this hook runs
+    if targets and context is not None and cursor.description is not None:
+        context.cursor = _CountingCursor(cursor, targets)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    if exception_context.connection is not None:
+        _finished(exception_context.connection)
+
+
+def instrument(*engines):
+    """Attach the statement hooks to sync engines (pass async_engine.sync_engine)."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+@contextlib.contextmanager
+def statement_budget(limit: int) -> Iterator[QueryStats]:
+    """
+    Fail with AssertionError if more than `limit` SQL statements run while
+    the block is open, e.g. to pin an endpoint's query count in a test:
+
+        with statement_budget(3):
+            client.get("/recipies", headers=auth)
+
+    Counts every statement in the process, so run nothing else alongside.
+    Needs the engines to have gone through instrument() (main.py does this).
+    """
+    stats = QueryStats()
+    with _budgets_lock:
+        _budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        with _budgets_lock:
+            _budgets.remove(stats)
+    assert stats.statements <= limit, f"{stats.statements} SQL statements, budget is {limit}"
+
+
+# --- Aggregation and exposition ---
+
+class _Histogram:
+    __slots__ = ("counts", "total", "sum")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, buckets: Sequence[float], value: float):
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+
+class _RouteStats:
+    __slots__ = ("statuses", "latency", "statements", "db_seconds", "rows")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.statements = _Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+class Registry:
+    """Per-route request and SQL totals, kept per worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: QueryStats):
+        with self._lock:
+            r = self._routes.get((method, route))
+            if r is None:
+                r = self._routes[(method, route)] = _RouteStats()
+            r.statuses[status] = r.statuses.get(status, 0) + 1
+            r.latency.observe(LATENCY_BUCKETS, seconds)
+            r.statements.observe(STATEMENT_BUCKETS, stats.statements)
+            r.db_seconds += stats.seconds
+            r.rows += stats.rows
+
+    def render(self) -> str:
+        """Everything recorded so far, in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP http_requests_total Requests handled, by route and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), r in routes:
+                for status, n in sorted(r.statuses.items()):
+                    lines.append(f"http_requests_total{_labels(method, route, status=status)} {n}")
+            _histogram(lines, "http_request_duration_seconds", "Request latency.",
+                       LATENCY_BUCKETS, [(k, r.latency) for k, r in routes])
+            _histogram(lines, "db_statements_per_request", "SQL statements issued per request.",
+                       STATEMENT_BUCKETS, [(k, r.statements) for k, r in routes])
+            lines += [
+                "# HELP db_statement_seconds_total Time spent executing SQL statements.",
+                "# TYPE db_statement_seconds_total counter",
+            ]
+            lines += [f"db_statement_seconds_total{_labels(*k)} {r.db_seconds:.6f}" for k, r in routes]
+            lines += [
+                "# HELP db_rows_fetched_total Rows read back from SQL statements.",
+                "# TYPE db_rows_fetched_total counter",
+            ]
+            lines += [f"db_rows_fetched_total{_labels(*k)} {r.rows}" for k, r in routes]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(method: str, route: str, **extra) -> str:
+    pairs = [("method", method), ("route", route)] + [(k, str(v)) for k, v in extra.items()]
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _bound(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _histogram(lines: List[str], name: str, help_text: str, buckets: Sequence[float], series):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), h in series:
+        running = 0
+        for bound, count in zip(list(map(_bound, buckets)) + ["+Inf"], h.counts):
+            running += count
+            lines.append(f"{name}_bucket{_labels(method, route, le=bound)} {running}")
+        lines.append(f"{name}_sum{_labels(method, route)} {h.sum:.6f}")
+        lines.append(f"{name}_count{_labels(method, route)} {h.total}")
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording each HTTP request into `registry`, labelled
+    by its route template (/recipies/{id}, not /recipies/42).
+
+    The request is timed until its last body chunk is sent, so streamed
+    responses include the queries made while streaming.
+    """
+
+    def __init__(self, app, registry: Registry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                route = scope.get("route")
+                path = getattr(route, "path", None) or UNMATCHED_ROUTE
+                self.registry.observe(scope["method"], path, status, time.perf_counter() - started, stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+            _current.reset(token)
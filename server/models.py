@@ -1,10 +1,14 @@
 # server/models.py
 
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import JSON, Column, DateTime, Integer, String, Text, ForeignKey, Index, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship, declarative_base
 
 Base = declarative_base()
 
+# JSON column type: JSONB on Postgres; Python None is stored as SQL NULL
+JSONValue = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -27,13 +31,19 @@ class UserUtensil(Base):
     __tablename__ = "user_utensils"
 
     id       = Column(Integer, primary_key=True, index=True)
-    user_id  = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id  = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     utensil  = Column(String, nullable=False)
 
     user     = relationship("User", back_populates="utensils")
 
 class Recipe(Base):
     __tablename__ = "recipes"
+    __table_args__ = (
+        # personal list: user_id = ? AND is_master_recipe = 0 ORDER BY id
+        Index("ix_recipes_user_id_is_master_recipe", "user_id", "is_master_recipe", "id"),
+        # master catalog: is_master_recipe = 1 ORDER BY id
+        Index("ix_recipes_is_master_recipe_id", "is_master_recipe", "id"),
+    )
 
     id               = Column(Integer, primary_key=True, index=True)
     title            = Column(String, nullable=False)
@@ -44,20 +54,60 @@ class Recipe(Base):
     user_id          = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner            = relationship("User", back_populates="recipes")
 
+    # A personal copy of a master recipe (POST /recipies/{id}/clone) keeps
+    # only what it changes: `overrides` maps the overridden fields ("title",
+    # "description", "utensils", "ingredients", "instructions") to their
+    # values, and everything else is read from the master through `parent`
+    # (see storage.values). A copy's title and description columns hold its
+    # resolved values as of its last write, for anything reading them raw.
+    parent_id        = Column(Integer, ForeignKey("recipes.id"), nullable=True, index=True)
+    overrides        = Column(JSONValue, nullable=True)
+    parent           = relationship("Recipe", remote_side=[id])
+
+    # {"utensils": [...], "ingredients": [...], "instructions": [...]}, the
+    # source of those lists when RECIPE_STORAGE=document (see storage.py).
+    # Only loaded when asked for, so normalized reads don't carry it.
+    document         = deferred(Column(JSONValue, nullable=True))
+
+    # Ordered by id: a collection's order is the order it was written in
     utensils     = relationship(
         "RecipeUtensil",
         back_populates="recipe",
         cascade="all, delete-orphan",
+        order_by="RecipeUtensil.id",
     )
     ingredients  = relationship(
         "RecipeIngredient",
         back_populates="recipe",
         cascade="all, delete-orphan",
+        order_by="RecipeIngredient.id",
     )
     instructions = relationship(
         "RecipeInstruction",
         back_populates="recipe",
         cascade="all, delete-orphan",
+        order_by="RecipeInstruction.id",
+    )
+    # The lists storage.values() reads: a recipe's own rows, or a personal
+    # copy's master's (a copy keeps its own lists in `overrides`). Read-only,
+    # so a selectinload of each serves a batch of recipes and copies alike.
+    source_utensils     = relationship(
+        "RecipeUtensil",
+        primaryjoin="foreign(RecipeUtensil.recipe_id) == func.coalesce(Recipe.parent_id, Recipe.id)",
+        viewonly=True,
+        order_by="RecipeUtensil.id",
+    )
+    source_ingredients  = relationship(
+        "RecipeIngredient",
+        primaryjoin="foreign(RecipeIngredient.recipe_id) == func.coalesce(Recipe.parent_id, Recipe.id)",
+        viewonly=True,
+        order_by="RecipeIngredient.id",
+    )
+    source_instructions = relationship(
+        "RecipeInstruction",
+        primaryjoin="foreign(RecipeInstruction.recipe_id) == func.coalesce(Recipe.parent_id, Recipe.id)",
+        viewonly=True,
+        order_by="RecipeInstruction.id",
     )
     ratings      = relationship(
         "Rating",
@@ -72,9 +122,13 @@ class Recipe(Base):
 
 class RecipeUtensil(Base):
     __tablename__ = "recipe_utensils"
+    __table_args__ = (
+        # equipment filter: utensil IN (...) -> recipe ids, answered from the index alone
+        Index("ix_recipe_utensils_utensil_recipe_id", "utensil", "recipe_id"),
+    )
 
     id        = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False, index=True)
     utensil   = Column(String, nullable=False)
 
     recipe    = relationship("Recipe", back_populates="utensils")
@@ -83,7 +137,7 @@ class RecipeIngredient(Base):
     __tablename__ = "recipe_ingredients"
 
     id        = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False, index=True)
     text      = Column(String, nullable=False)
 
     recipe    = relationship("Recipe", back_populates="ingredients")
@@ -92,13 +146,19 @@ class RecipeInstruction(Base):
     __tablename__ = "recipe_instructions"
 
     id        = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False, index=True)
     step      = Column(Text, nullable=False)
 
     recipe    = relationship("Recipe", back_populates="instructions")
 
 class Rating(Base):
     __tablename__ = "ratings"
+    __table_args__ = (
+        # one rating per user per recipe; also the ON CONFLICT target of ratings.save()
+        UniqueConstraint("recipe_id", "user_id", name="uq_ratings_recipe_id_user_id"),
+        # a user's ratings: user_id = ? [AND recipe_id IN (...)], rating read from the index
+        Index("ix_ratings_user_id_recipe_id_rating", "user_id", "recipe_id", "rating"),
+    )
 
     id        = Column(Integer, primary_key=True, index=True)
     recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
@@ -108,11 +168,44 @@ class Rating(Base):
     recipe    = relationship("Recipe", back_populates="ratings")
     user      = relationship("User")
 
+class RecipeRatingStats(Base):
+    __tablename__ = "recipe_rating_stats"
+
+    # Running totals over a recipe's ratings, kept in step by ratings.record()
+    # in the same transaction as the rating write itself.
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), primary_key=True)
+    count     = Column(Integer, nullable=False, default=0)
+    total     = Column(Integer, nullable=False, default=0)
+    stars_1   = Column(Integer, nullable=False, default=0)
+    stars_2   = Column(Integer, nullable=False, default=0)
+    stars_3   = Column(Integer, nullable=False, default=0)
+    stars_4   = Column(Integer, nullable=False, default=0)
+    stars_5   = Column(Integer, nullable=False, default=0)
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+
+    # A single row, moved on by catalog.bump_catalog() in the same
+    # transaction as every write to master recipes. Each worker compares its
+    # cached catalog with it, so all of them see a change and tag it alike.
+    id      = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        # a user's notes, newest first: user_id = ? [AND recipe_id = ? / IN (...)]
+        # ORDER BY created_at DESC, id DESC
+        Index("ix_notes_user_id_recipe_id_created_at", "user_id", "recipe_id", "created_at", "id"),
+    )
 
-    id        = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
-    content   = Column(Text, nullable=False)
+    id         = Column(Integer, primary_key=True, index=True)
+    recipe_id  = Column(Integer, ForeignKey("recipes.id"), nullable=False, index=True)
+    # NULL for legacy notes whose author couldn't be determined (see the
+    # add_note_owner_created_at migration); every notes query filters on
+    # user_id, so nobody sees them
+    user_id    = Column(Integer, ForeignKey("users.id"), nullable=True)
+    content    = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
 
-    recipe    = relationship("Recipe", back_populates="notes")
+    recipe     = relationship("Recipe", back_populates="notes")
@@ -0,0 +1,126 @@
+# server/notes.py
+
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Select, and_, delete, func, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+Note = models.Note
+
+# The caller's newest notes included per recipe in recipe list and detail
+# responses; the rest are paged through GET /recipies/{id}/notes.
+LIST_NOTES = int(os.getenv("LIST_NOTES", "3"))
+
+# Page size of GET /recipies/{id}/notes when ?limit= is not given, and the cap
+NOTES_PAGE_SIZE = 20
+MAX_NOTES_PAGE_SIZE = 100
+
+# Newest first; id breaks ties between notes written in the same instant
+NEWEST_FIRST = (Note.created_at.desc(), Note.id.desc())
+
+
+def to_out(note_id: int, content: str, created_at) -> dict:
+    return {"id": note_id, "note": content, "createdAt": created_at}
+
+
+def visible(db: Session, user_id: int, recipe_ids: Iterable[int]) -> Set[int]:
+    """Those of `recipe_ids` the user may write notes on: master recipes and their own."""
+    return set(db.scalars(
+        select(models.Recipe.id).where(
+            models.Recipe.id.in_(list(recipe_ids)),
+            or_(models.Recipe.is_master_recipe == 1, models.Recipe.user_id == user_id),
+        )
+    ))
+
+
+def ranked(user_id: int, recipe_ids: Optional[Iterable[int]] = None, limit: int = LIST_NOTES) -> Select:
+    """
+    The user's notes ranked newest first within each recipe, cut at
+    `limit` (at least one per recipe, which still carries the count): a
+    window ranks and counts them in the same pass over
+    ix_notes_user_id_recipe_id_created_at. Columns are id, recipe_id,
+    content, created_at, rank and total; summarize() reads them.
+    """
+    rank = func.row_number().over(partition_by=Note.recipe_id, order_by=NEWEST_FIRST).label("rank")
+    total = func.count().over(partition_by=Note.recipe_id).label("total")
+    q = select(Note.id, Note.recipe_id, Note.content, Note.created_at, rank, total).where(Note.user_id == user_id)
+    if recipe_ids is not None:
+        q = q.where(Note.recipe_id.in_(list(recipe_ids)))
+    ranked = q.subquery()
+    return select(ranked).where(ranked.c.rank <= max(limit, 1))
+
+
+def summarize(rows: Iterable, limit: int = LIST_NOTES) -> Dict[int, Tuple[int, List[dict]]]:
+    """Fold ranked() rows, ordered by recipe_id and rank descending, into latest()'s map."""
+    out: Dict[int, Tuple[int, List[dict]]] = {}
+    for r in rows:
+        _, notes = out.setdefault(r.recipe_id, (r.total, []))
+        if r.rank <= limit:
+            notes.append(to_out(r.id, r.content, r.created_at))
+    return out
+
+
+def latest(
+    db: Session, user_id: int, recipe_ids: Optional[Iterable[int]] = None, limit: int = LIST_NOTES
+) -> Dict[int, Tuple[int, List[dict]]]:
+    """
+    Map recipe id -> (number of notes the user has on it, their `limit`
+    newest notes, oldest of those first), in a single query.
+    """
+    q = ranked(user_id, recipe_ids, limit).subquery()
+    return summarize(db.execute(select(q).order_by(q.c.recipe_id, q.c.rank.desc())), limit)
+
+
+def page(
+    db: Session, user_id: int, recipe_id: int, limit: int = NOTES_PAGE_SIZE, before: Optional[int] = None
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    The user's notes on a recipe, newest first: up to `limit` of them older
+    than note `before`. Returns (notes, cursor for the next page or None).
+    """
+    q = (
+        select(Note.id, Note.content, Note.created_at)
+        .where(Note.user_id == user_id, Note.recipe_id == recipe_id)
+        .order_by(*NEWEST_FIRST)
+        .limit(limit + 1)
+    )
+    if before is not None:
+        # keyset on (created_at, id), read from the cursor note in the same statement
+        cursor = select(Note.created_at).where(Note.id == before).scalar_subquery()
+        q = q.where(or_(Note.created_at < cursor, and_(Note.created_at == cursor, Note.id < before)))
+    rows = db.execute(q).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [to_out(*r) for r in rows], (rows[-1].id if more else None)
+
+
+def count(db: Session, user_id: int, recipe_id: int) -> int:
+    return db.scalar(
+        select(func.count()).select_from(Note).where(Note.user_id == user_id, Note.recipe_id == recipe_id)
+    )
+
+
+def add(db: Session, user_id: int, recipe_id: int, content: str) -> int:
+    note = Note(recipe_id=recipe_id, user_id=user_id, content=content)
+    db.add(note)
+    db.flush()
+    return note.id
+
+
+def remove(db: Session, user_id: int, keys: Iterable[Tuple[int, int]]) -> int:
+    """
+    Delete the user's notes given as (recipe id, note id) pairs, by primary
+    key in one statement. Returns how many were deleted; notes that don't
+    exist or belong to someone else are left alone.
+    """
+    keys = list(keys)
+    if not keys:
+        return 0
+    return db.execute(
+        delete(Note)
+        .where(Note.user_id == user_id, tuple_(Note.recipe_id, Note.id).in_(keys))
+        .execution_options(synchronize_session=False)
+    ).rowcount
@@ -0,0 +1,132 @@
+# server/passwords.py
+
+import asyncio
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# bcrypt work factor. Raising it makes existing hashes "deprecated": they are
+# re-hashed at the new cost the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Threads doing bcrypt work (the C extension releases the GIL), and how many
+# more requests may wait for one before we answer 503.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+
+class OpStats:
+    def __init__(self):
+        self.count = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "rejected": self.rejected,
+            "waitSecondsAvg": round(self.wait_seconds / self.count, 6) if self.count else 0.0,
+            "runSecondsAvg": round(self.run_seconds / self.count, 6) if self.count else 0.0,
+            "secondsMax": round(self.max_seconds, 6),
+        }
+
+
+class HashingPool:
+    """
+    Dedicated, bounded thread pool for password hashing.
+
+    Hashing never runs on the event loop or on FastAPI's shared threadpool.
+    At most `workers + queue_limit` operations are admitted at once; past
+    that, callers get a 503 straight away instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_limit: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, OpStats] = {}
+
+    def _op(self, name: str) -> OpStats:
+        with self._lock:
+            return self._stats.setdefault(name, OpStats())
+
+    async def run(self, name: str, fn: Callable, *args):
+        stats = self._op(name)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                stats.rejected += 1
+            logger.warning("Password pool full, rejecting %s", name)
+            raise HTTPException(503, "Server busy, please retry", headers={"Retry-After": "1"})
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                done = time.perf_counter()
+                with self._lock:
+                    stats.count += 1
+                    stats.wait_seconds += started - submitted
+                    stats.run_seconds += done - started
+                    stats.max_seconds = max(stats.max_seconds, done - submitted)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            ops = {name: s.snapshot() for name, s in self._stats.items()}
+        return {
+            "workers": self.workers,
+            "queueLimit": self.queue_limit,
+            "bcryptRounds": BCRYPT_ROUNDS,
+            "operations": ops,
+        }
+
+
+pool = HashingPool()
+
+
+def _verify(password: str, stored: str) -> Tuple[bool, Optional[str]]:
+    if pwd_context.identify(stored, required=False) is None:
+        # Accounts created before hashing store the password as-is; a
+        # successful login upgrades them to a real hash.
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+        return ok, pwd_context.hash(password) if ok else None
+    return pwd_context.verify_and_update(password, stored)
+
+
+async def hash_password(password: str) -> str:
+    return await pool.run("hash", pwd_context.hash, password)
+
+
+async def verify_password(password: str, stored: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check `password` against the stored value. The second item is a fresh
+    hash when the stored one should be replaced (plaintext, or hashed with
+    an outdated cost), else None.
+    """
+    return await pool.run("verify", _verify, password, stored)
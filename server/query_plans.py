@@ -0,0 +1,18 @@
+# server/query_plans.py
+"""
+Query-plan and statement-count regression check. The checks are the
+pytest module tests/test_query_plans.py and run with the rest of the
+suite (python -m pytest); this runs just them. Run from server/:
+
+    python query_plans.py        # -v lists every access path
+    RECIPE_STORAGE=document python query_plans.py
+"""
+
+import os
+import sys
+
+import pytest
+
+if __name__ == "__main__":
+    tests = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "test_query_plans.py")
+    sys.exit(pytest.main([tests, "-q", *sys.argv[1:]]))
@@ -0,0 +1,214 @@
+# server/ratings.py
+
+import json
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from sqlalchemy import Float, case, cast, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+Stats = models.RecipeRatingStats
+
+# Star values with their own histogram bucket (RatingIn accepts these only)
+STARS = range(1, 6)
+BUCKETS = {n: getattr(Stats, f"stars_{n}") for n in STARS}
+
+# Stats columns in table order after recipe_id
+STAT_COLUMNS = [Stats.count, Stats.total, *BUCKETS.values()]
+_EMPTY = (0,) * len(STAT_COLUMNS)
+
+# INSERT constructs with ON CONFLICT support, per backend we run on
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Drifted recipe ids echoed back in a reconcile report
+MAX_REPORTED_DRIFT = 100
+
+
+# --- Incremental maintenance ---
+
+def _deltas(removed: List[int], added: List[int]) -> Dict[str, int]:
+    values = {"count": len(added) - len(removed), "total": sum(added) - sum(removed)}
+    buckets = Counter(v for v in added if v in BUCKETS)
+    buckets.subtract(v for v in removed if v in BUCKETS)
+    values.update((f"stars_{n}", d) for n, d in buckets.items() if d)
+    return values
+
+
+def record(db: Session, recipe_id: int, removed: Iterable[int] = (), added: Iterable[int] = ()):
+    """
+    Fold a rating change into the recipe's stats row: `removed` are the
+    rating values that went away, `added` the ones that were written. Runs
+    in the caller's transaction, so the aggregate commits (or rolls back)
+    with the rating itself.
+    """
+    deltas = _deltas(list(removed), list(added))
+    if not any(deltas.values()):
+        return
+
+    bump = (
+        update(Stats)
+        .where(Stats.recipe_id == recipe_id)
+        .values({getattr(Stats, k): getattr(Stats, k) + d for k, d in deltas.items()})
+    )
+    options = {"synchronize_session": False}
+    if db.execute(bump, execution_options=options).rowcount:
+        return
+
+    # First rating for this recipe
+    try:
+        with db.begin_nested():
+            db.execute(insert(Stats).values(recipe_id=recipe_id, **deltas))
+    except IntegrityError:
+        # a concurrent first rating created the row in the meantime
+        db.execute(bump, execution_options=options)
+
+
+def forget(db: Session, recipe_id: int):
+    """Drop a recipe's stats row; call before deleting the recipe."""
+    db.execute(delete(Stats).where(Stats.recipe_id == recipe_id), execution_options={"synchronize_session": False})
+
+
+def save(db: Session, user_id: int, values: Dict[int, int]) -> int:
+    """
+    Set `user_id`'s rating of each recipe in `values` (recipe id -> stars)
+    with one multi-row INSERT ... ON CONFLICT DO UPDATE, and fold the
+    changes into the aggregates. Ratings that are already set to the same
+    value are skipped. Returns the number of ratings written; the caller
+    commits.
+    """
+    previous = dict(db.execute(
+        select(models.Rating.recipe_id, models.Rating.rating)
+        .where(models.Rating.user_id == user_id, models.Rating.recipe_id.in_(list(values)))
+        .with_for_update()
+    ).all())
+    changed = {recipe_id: v for recipe_id, v in values.items() if previous.get(recipe_id) != v}
+    if not changed:
+        return 0
+
+    upsert = UPSERT_INSERTS[db.get_bind().dialect.name](models.Rating).values(
+        [{"recipe_id": recipe_id, "user_id": user_id, "rating": v} for recipe_id, v in changed.items()]
+    )
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=[models.Rating.recipe_id, models.Rating.user_id],
+        set_={"rating": upsert.excluded.rating},
+    ))
+
+    # Two first-time ratings of the same recipe racing each other can both
+    # count as new here; reconcile() repairs that.
+    for recipe_id, v in changed.items():
+        old = previous.get(recipe_id)
+        record(db, recipe_id, removed=[] if old is None else [old], added=[v])
+    return len(changed)
+
+
+# --- Analytics ---
+
+def _summary(recipe_id: int, title: str, count: int, total: int, *buckets: int) -> dict:
+    return {
+        "id": recipe_id,
+        "title": title,
+        "ratings": count,
+        "average": round(total / count, 2) if count else 0.0,
+        "distribution": {str(n): b for n, b in zip(STARS, buckets)},
+    }
+
+
+def analytics(db: Session, limit: int = 10, min_ratings: int = 1) -> dict:
+    """
+    Rating overview for the master catalog, from the aggregates alone:
+    overall average and distribution, plus the best and worst rated recipes
+    among those with at least `min_ratings` ratings.
+    """
+    master = (models.Recipe.id == Stats.recipe_id) & (models.Recipe.is_master_recipe == 1)
+
+    totals = db.execute(
+        select(func.count(), *(func.coalesce(func.sum(c), 0) for c in STAT_COLUMNS))
+        .select_from(Stats)
+        .join(models.Recipe, master)
+        .where(Stats.count > 0)
+    ).one()
+    rated, count, total, *buckets = totals
+
+    ranked = (
+        select(Stats.recipe_id, models.Recipe.title, *STAT_COLUMNS)
+        .join(models.Recipe, master)
+        .where(Stats.count >= max(min_ratings, 1))
+        .limit(limit)
+    )
+    average = cast(Stats.total, Float) / Stats.count
+    top = db.execute(ranked.order_by(average.desc(), Stats.count.desc(), Stats.recipe_id)).all()
+    bottom = db.execute(ranked.order_by(average.asc(), Stats.count.desc(), Stats.recipe_id)).all()
+
+    return {
+        "recipesRated": rated,
+        "ratings": count,
+        "average": round(total / count, 2) if count else 0.0,
+        "distribution": {str(n): b for n, b in zip(STARS, buckets)},
+        "top": [_summary(*row) for row in top],
+        "bottom": [_summary(*row) for row in bottom],
+    }
+
+
+# --- Reconciliation ---
+
+def _recompute():
+    """The stats table as it should be: one GROUP BY over ratings."""
+    r = models.Rating
+    return (
+        select(
+            r.recipe_id,
+            func.count(),
+            func.sum(r.rating),
+            *(func.sum(case((r.rating == n, 1), else_=0)) for n in STARS),
+        )
+        .group_by(r.recipe_id)
+    )
+
+
+def reconcile(db: Session) -> dict:
+    """
+    Recompute every recipe's aggregates from the ratings table and, if any
+    stored row has drifted, replace the table's contents with the fresh
+    figures in one INSERT ... SELECT. Commits.
+    """
+    started = time.perf_counter()
+    fresh = {row[0]: tuple(row[1:]) for row in db.execute(_recompute())}
+    stored = {row[0]: tuple(row[1:]) for row in db.execute(select(Stats.recipe_id, *STAT_COLUMNS))}
+    drifted = sorted(
+        recipe_id for recipe_id in fresh.keys() | stored.keys()
+        if fresh.get(recipe_id, _EMPTY) != stored.get(recipe_id, _EMPTY)
+    )
+
+    if drifted:
+        db.execute(delete(Stats), execution_options={"synchronize_session": False})
+        db.execute(
+            insert(Stats).from_select([Stats.recipe_id.key, *(c.key for c in STAT_COLUMNS)], _recompute())
+        )
+        db.commit()
+        logger.warning("Rating stats drifted for %d recipes; recomputed", len(drifted))
+
+    seconds = time.perf_counter() - started
+    return {
+        "recipes": len(fresh),
+        "drifted": len(drifted),
+        "driftedIds": drifted[:MAX_REPORTED_DRIFT],
+        "seconds": round(seconds, 3),
+    }
+
+
+if __name__ == "__main__":
+    # Run from cron or by hand:  python ratings.py
+    with SessionLocal() as db:
+        print(json.dumps(reconcile(db)))
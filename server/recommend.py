@@ -0,0 +1,399 @@
+# server/recommend.py
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Similar recipes kept per recipe
+RECOMMEND_NEIGHBORS = int(os.getenv("RECOMMEND_NEIGHBORS", "20"))
+
+# Full rebuild (in the background) once the model is this old; between
+# rebuilds new ratings are folded in incrementally.
+RECOMMEND_REBUILD_SECONDS = int(os.getenv("RECOMMEND_REBUILD_SECONDS", "3600"))
+
+# Recipes whose similarity columns are computed in one sparse product; bounds
+# the dense (recipes x block) scratch array during a build.
+SIMILARITY_BLOCK = 256
+
+# Ratings a recipe needs before it is offered as a popular fallback
+POPULAR_MIN_RATINGS = 3
+
+
+def top_neighbors(
+    matrix: sparse.csc_matrix, columns: np.ndarray, k: int, keep_full: bool = False
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Cosine similarity of each of `columns` against every column of the
+    users x recipes `matrix`, cut down to the best `k`.
+
+    Returns (neighbors, similarity, full) where neighbors/similarity are
+    len(columns) x k, best first, padded with -1 / 0.0. With `keep_full`,
+    `full` is the dense recipes x len(columns) similarity block (for
+    patching other recipes' lists after an incremental update); otherwise
+    it is None, and only one SIMILARITY_BLOCK of columns is dense at a time.
+    """
+    n_items = matrix.shape[1]
+    neighbors = np.full((len(columns), k), -1, dtype=np.int64)
+    similarity = np.zeros((len(columns), k))
+    full = np.zeros((n_items, len(columns))) if keep_full else None
+    if not len(columns) or n_items < 2:
+        return neighbors, similarity, full
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    take = min(k, n_items - 1)
+    for start in range(0, len(columns), SIMILARITY_BLOCK):
+        block = columns[start:start + SIMILARITY_BLOCK]
+        sims = (matrix.T @ matrix[:, block]).toarray()
+        scale = norms[:, None] * norms[block][None, :]
+        np.divide(sims, scale, out=sims, where=scale > 0)
+        sims[scale == 0] = 0.0
+        sims[block, np.arange(len(block))] = 0.0  # not your own neighbor
+        if full is not None:
+            full[:, start:start + len(block)] = sims
+
+        best = np.argpartition(-sims, take - 1, axis=0)[:take]
+        values = np.take_along_axis(sims, best, axis=0)
+        order = np.argsort(-values, axis=0, kind="stable")
+        best = np.take_along_axis(best, order, axis=0).T
+        values = np.take_along_axis(values, order, axis=0).T
+        best[values <= 0] = -1
+        values[values <= 0] = 0.0
+        neighbors[start:start + len(block), :take] = best
+        similarity[start:start + len(block), :take] = values
+    return neighbors, similarity, full
+
+
+class _Model:
+    """
+    One snapshot of the recommender: the sparse users x recipes rating
+    matrix (master recipes only) and each recipe's top-K similar recipes.
+    """
+
+    def __init__(self, k: int, ratings: List[Tuple[int, int, int]], recipe_ids: Iterable[int]):
+        self.k = k
+        self.item_ids = np.array(sorted(set(recipe_ids)), dtype=np.int64)
+        self.items: Dict[int, int] = {int(r): c for c, r in enumerate(self.item_ids)}
+        self.users: Dict[int, int] = {}
+        self.rated: Dict[int, Dict[int, float]] = {}  # user id -> {column: rating}
+
+        rows, cols, values = [], [], []
+        for user_id, recipe_id, rating in ratings:
+            col = self.items.get(recipe_id)
+            if col is None:
+                continue
+            row = self.users.setdefault(user_id, len(self.users))
+            self.rated.setdefault(user_id, {})[col] = float(rating)
+            rows.append(row)
+            cols.append(col)
+            values.append(float(rating))
+        self.matrix = sparse.csc_matrix(
+            (values, (rows, cols)), shape=(len(self.users), len(self.item_ids))
+        )
+        self.removed = np.zeros(len(self.item_ids), dtype=bool)
+        self.neighbors, self.similarity, _ = top_neighbors(
+            self.matrix, np.arange(len(self.item_ids)), k
+        )
+
+    # --- incremental updates ---
+
+    def add_recipes(self, recipe_ids: Iterable[int]):
+        new = [r for r in recipe_ids if r not in self.items]
+        if not new:
+            return
+        for r in new:
+            self.items[r] = len(self.item_ids)
+            self.item_ids = np.append(self.item_ids, r)
+        n = len(self.item_ids)
+        self.matrix.resize((self.matrix.shape[0], n))
+        self.removed = np.append(self.removed, np.zeros(len(new), dtype=bool))
+        self.neighbors = np.vstack([self.neighbors, np.full((len(new), self.k), -1, dtype=np.int64)])
+        self.similarity = np.vstack([self.similarity, np.zeros((len(new), self.k))])
+
+    def remove_recipe(self, recipe_id: int):
+        col = self.items.get(recipe_id)
+        if col is not None:
+            self.removed[col] = True
+
+    def apply(self, changes: Dict[Tuple[int, int], Optional[int]]) -> int:
+        """
+        Set (user, recipe) cells to new ratings (None clears one), then
+        recompute the neighbor lists of the touched recipes and patch their
+        entry into every other recipe's list. Returns recipes touched.
+        """
+        cells = [(u, self.items[r], v) for (u, r), v in changes.items() if r in self.items]
+        if not cells:
+            return 0
+        for user_id, _, _ in cells:
+            self.users.setdefault(user_id, len(self.users))
+        if len(self.users) > self.matrix.shape[0]:
+            self.matrix.resize((len(self.users), self.matrix.shape[1]))
+
+        rows, cols, deltas = [], [], []
+        for user_id, col, value in cells:
+            mine = self.rated.setdefault(user_id, {})
+            old = mine.get(col, 0.0)
+            if value is None:
+                mine.pop(col, None)
+            else:
+                mine[col] = float(value)
+            new = 0.0 if value is None else float(value)
+            if new != old:
+                rows.append(self.users[user_id])
+                cols.append(col)
+                deltas.append(new - old)
+        if not deltas:
+            return 0
+        self.matrix = (self.matrix + sparse.csc_matrix((deltas, (rows, cols)), shape=self.matrix.shape)).tocsc()
+        self.matrix.eliminate_zeros()
+
+        touched = np.unique(cols)
+        neighbors, similarity, full = top_neighbors(self.matrix, touched, self.k, keep_full=True)
+        self.neighbors[touched] = neighbors
+        self.similarity[touched] = similarity
+        for i, col in enumerate(touched):
+            self._patch(col, full[:, i])
+        return len(touched)
+
+    def _patch(self, col: int, sims: np.ndarray):
+        # Other recipes that list `col` get its new similarity; ones that
+        # don't, but now beat their weakest neighbor, take it in. A recipe
+        # whose similarity fell keeps its slot until it is outranked or the
+        # next full rebuild.
+        listed = self.neighbors == col
+        rows = np.flatnonzero(listed.any(axis=1))
+        self.similarity[listed] = sims[np.nonzero(listed)[0]]
+
+        weakest = self.similarity[:, -1]
+        entering = np.flatnonzero((sims > weakest) & ~listed.any(axis=1))
+        entering = entering[entering != col]
+        self.neighbors[entering, -1] = col
+        self.similarity[entering, -1] = sims[entering]
+
+        changed = np.union1d(rows, entering)
+        if len(changed):
+            order = np.argsort(-self.similarity[changed], axis=1, kind="stable")
+            self.neighbors[changed] = np.take_along_axis(self.neighbors[changed], order, axis=1)
+            self.similarity[changed] = np.take_along_axis(self.similarity[changed], order, axis=1)
+            dropped = self.similarity[changed] <= 0
+            self.neighbors[changed] = np.where(dropped, -1, self.neighbors[changed])
+            self.similarity[changed] = np.where(dropped, 0.0, self.similarity[changed])
+
+    # --- serving ---
+
+    def predict(self, user_id: int, limit: int) -> List[Tuple[int, float]]:
+        """(recipe id, predicted rating) for recipes the user hasn't rated, best first."""
+        mine = self.rated.get(user_id)
+        if not mine:
+            return []
+        cols = np.fromiter(mine.keys(), dtype=np.int64, count=len(mine))
+        ratings = np.fromiter(mine.values(), dtype=float, count=len(mine))
+
+        nb = self.neighbors[cols]
+        sims = self.similarity[cols]
+        valid = nb >= 0
+        valid[valid] = ~self.removed[nb[valid]]
+
+        scores = np.zeros(len(self.item_ids))
+        weights = np.zeros(len(self.item_ids))
+        np.add.at(scores, nb[valid], (sims * ratings[:, None])[valid])
+        np.add.at(weights, nb[valid], sims[valid])
+        weights[cols] = 0.0
+        weights[self.removed] = 0.0
+
+        candidates = np.flatnonzero(weights > 0)
+        predicted = scores[candidates] / weights[candidates]
+        # best predicted rating first; more supporting similarity breaks ties
+        order = np.lexsort((-weights[candidates], -predicted))[:limit]
+        return [(int(self.item_ids[candidates[i]]), float(predicted[i])) for i in order]
+
+
+class Recommender:
+    """
+    Item-item collaborative filtering over master recipes.
+
+    Ratings written after the last build are queued by note_rating() and
+    folded in by refresh() on the next request: only the touched recipes'
+    similarity columns are recomputed. A full rebuild runs in a background
+    thread every RECOMMEND_REBUILD_SECONDS, with the old model serving in
+    the meantime.
+    """
+
+    def __init__(self, k: int = RECOMMEND_NEIGHBORS, rebuild_seconds: int = RECOMMEND_REBUILD_SECONDS):
+        self.k = k
+        self.rebuild_seconds = rebuild_seconds
+        self._model: Optional[_Model] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._first_build = threading.Lock()
+        self._pending: Dict[Tuple[int, int], Optional[int]] = {}
+        self._removed: List[int] = []
+        # Changes noted while a rebuild is reading the database; replayed
+        # onto the new model (setting a cell is idempotent)
+        self._replay: Optional[Dict[Tuple[int, int], Optional[int]]] = None
+        self.built_at = 0.0
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.refreshes = 0
+
+    # --- write side ---
+
+    def note_ratings(self, user_id: int, values: Dict[int, Optional[int]]):
+        """Queue committed rating changes (recipe id -> stars, None = removed)."""
+        with self._lock:
+            for recipe_id, value in values.items():
+                self._pending[(user_id, recipe_id)] = value
+                if self._replay is not None:
+                    self._replay[(user_id, recipe_id)] = value
+
+    def note_recipe_deleted(self, recipe_id: int):
+        with self._lock:
+            self._removed.append(recipe_id)
+
+    # --- building ---
+
+    def _load(self, db: Session) -> _Model:
+        started = time.perf_counter()
+        recipe_ids = db.scalars(select(models.Recipe.id).where(models.Recipe.is_master_recipe == 1)).all()
+        ratings = db.execute(select(models.Rating.user_id, models.Rating.recipe_id, models.Rating.rating)).all()
+        model = _Model(self.k, ratings, recipe_ids)
+        seconds = time.perf_counter() - started
+        self.builds += 1
+        self.build_seconds = seconds
+        logger.info(
+            "Built recommender: %d users x %d recipes, %d ratings in %.2fs",
+            model.matrix.shape[0], model.matrix.shape[1], model.matrix.nnz, seconds,
+        )
+        return model
+
+    def rebuild(self, db: Session):
+        """Rebuild from the database and swap the new model in."""
+        with self._build_lock:
+            with self._lock:
+                self._replay = {}
+            try:
+                model = self._load(db)
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+            with self._lock:
+                model.apply(self._replay)
+                self._replay = None
+                self._model = model
+                self.built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        def run():
+            try:
+                with SessionLocal() as db:
+                    self.rebuild(db)
+            except Exception:
+                logger.exception("Recommender rebuild failed")
+        if not self._build_lock.locked():
+            threading.Thread(target=run, name="recommender-rebuild", daemon=True).start()
+
+    def refresh(self, db: Session):
+        """Build on first use; otherwise fold in queued changes."""
+        if self._model is None:
+            with self._first_build:
+                if self._model is None:
+                    self.rebuild(db)
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            removed, self._removed = self._removed, []
+        if pending:
+            # Ratings of master recipes created since the last build
+            unknown = {r for _, r in pending if r not in self._model.items}
+            new_recipes = db.scalars(
+                select(models.Recipe.id)
+                .where(models.Recipe.id.in_(unknown), models.Recipe.is_master_recipe == 1)
+            ).all() if unknown else []
+
+        with self._lock:
+            model = self._model
+            if pending:
+                model.add_recipes(new_recipes)
+                touched = model.apply(pending)
+                self.refreshes += 1
+                logger.debug("Recommender refresh: %d changes, %d recipes touched", len(pending), touched)
+            for recipe_id in removed:
+                model.remove_recipe(recipe_id)
+
+        if time.monotonic() - self.built_at > self.rebuild_seconds:
+            self._rebuild_in_background()
+
+    # --- read side ---
+
+    def recommend(self, db: Session, user_id: int, limit: int) -> List[Tuple[int, float]]:
+        self.refresh(db)
+        with self._lock:
+            return self._model.predict(user_id, limit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            model = self._model
+            return {
+                "built": model is not None,
+                "users": model.matrix.shape[0] if model else 0,
+                "recipes": model.matrix.shape[1] if model else 0,
+                "ratings": int(model.matrix.nnz) if model else 0,
+                "neighbors": self.k,
+                "builds": self.builds,
+                "lastBuildSeconds": round(self.build_seconds, 3),
+                "ageSeconds": round(time.monotonic() - self.built_at, 1) if model else None,
+                "incrementalRefreshes": self.refreshes,
+                "pending": len(self._pending),
+            }
+
+
+recommender = Recommender()
+
+
+def popular(db: Session, limit: int, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+    """Best-rated master recipes, from the rating aggregates; the cold-start fallback."""
+    stats = models.RecipeRatingStats
+    average = cast(stats.total, Float) / stats.count
+    q = (
+        select(stats.recipe_id, average)
+        .join(models.Recipe, models.Recipe.id == stats.recipe_id)
+        .where(models.Recipe.is_master_recipe == 1, stats.count >= POPULAR_MIN_RATINGS)
+        .order_by(average.desc(), stats.count.desc())
+    )
+    exclude = list(exclude)
+    if exclude:
+        q = q.where(stats.recipe_id.not_in(exclude))
+    return [(recipe_id, float(avg)) for recipe_id, avg in db.execute(q.limit(limit))]
+
+
+def recommendations(db: Session, user_id: int, limit: int) -> List[dict]:
+    """
+    Up to `limit` master recipes for the user: collaborative-filtering
+    predictions first, topped up with popular recipes they haven't rated.
+    """
+    picks = [(r, score, "similar") for r, score in recommender.recommend(db, user_id, limit)]
+    if len(picks) < limit:
+        rated = db.scalars(select(models.Rating.recipe_id).where(models.Rating.user_id == user_id)).all()
+        seen = set(rated) | {r for r, _, _ in picks}
+        picks += [(r, score, "popular") for r, score in popular(db, limit - len(picks), seen)]
+
+    titles = dict(db.execute(
+        select(models.Recipe.id, models.Recipe.title).where(models.Recipe.id.in_([r for r, _, _ in picks]))
+    ).all()) if picks else {}
+    return [
+        {"id": r, "title": titles[r], "predictedRating": round(score, 2), "reason": reason}
+        for r, score, reason in picks
+        if r in titles
+    ]
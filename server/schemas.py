@@ -0,0 +1,168 @@
+# server/schemas.py
+
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
+
+
+# --- Schemas ---
+
+class UserCreate(BaseModel):
+    Username: str
+    Password: str
+    Utensils: List[str] = []
+
+class UserLogin(BaseModel):
+    Username: str
+    Password: str
+
+class EquipmentOut(BaseModel):
+    equipment: List[str]
+
+class EquipmentIn(BaseModel):
+    Utensils: List[str]
+
+class RecipeCreate(BaseModel):
+    Title: str
+    Description: str = ""
+    Utensils: List[Dict[str, str]]
+    Recipie: str
+    Ingredients: List[str] = []
+
+class NoteOut(BaseModel):
+    id: int
+    note: str
+    createdAt: datetime
+
+class RecipeDetailOut(BaseModel):
+    id: int
+    title: str
+    description: str
+    equipment: List[str]
+    ingredients: List[str]
+    instructions: List[str]
+    userRating: int
+    userNotes: List[str]   # text of `notes`, kept for older clients
+    notes: List[NoteOut]   # the caller's newest notes on the recipe, oldest first
+    noteCount: int         # all of the caller's notes on the recipe
+    isMasterRecipe: bool
+    parentId: Optional[int]  # the master recipe a personal copy reads unchanged fields from
+    overrides: List[str]     # the fields a personal copy has changed from its master
+
+class RecipesOut(BaseModel):
+    recipes: List[RecipeDetailOut]
+
+class RecipeUpdate(BaseModel):
+    Title: str
+    Description: str = ""
+    Utensils: List[Dict[str, str]]
+    Recipie: str
+    Ingredients: List[str] = []
+
+class RecipePatch(BaseModel):
+    # Partial update: only the fields that are sent are compared and written
+    Title: Optional[str] = None
+    Description: Optional[str] = None
+    Utensils: Optional[List[Dict[str, str]]] = None
+    Recipie: Optional[str] = None
+    Ingredients: Optional[List[str]] = None
+
+class RatingIn(BaseModel):
+    rating: int = Field(..., ge=1, le=5)
+
+class NoteIn(BaseModel):
+    note: str
+
+class RatingChange(BaseModel):
+    recipeId: int
+    rating: int = Field(..., ge=1, le=5)
+
+class NoteAdd(BaseModel):
+    recipeId: int
+    note: str
+
+class NoteRemove(BaseModel):
+    recipeId: int
+    id: int
+
+class NotesPageOut(BaseModel):
+    notes: List[NoteOut]   # newest first
+    count: int
+    nextBefore: Optional[int] = None   # pass as ?before= for the next page
+
+class BatchChanges(BaseModel):
+    ratings: List[RatingChange] = []
+    notes: List[NoteAdd] = []
+    deletedNotes: List[NoteRemove] = []
+
+class RecommendationOut(BaseModel):
+    id: int
+    title: str
+    predictedRating: float
+    reason: str   # "similar" (collaborative filtering) or "popular" (fallback)
+
+class RecommendationsOut(BaseModel):
+    recipes: List[RecommendationOut]
+
+class RecipeRef(BaseModel):
+    id: int
+    title: str
+    isMasterRecipe: bool
+
+class DuplicateOut(RecipeRef):
+    similarity: float   # estimated Jaccard similarity of the recipes' shingles
+
+class DuplicatesOut(BaseModel):
+    duplicates: List[DuplicateOut]
+
+class DuplicatePairOut(BaseModel):
+    recipe: RecipeRef
+    duplicate: RecipeRef
+    similarity: float
+
+class DuplicatePairsOut(BaseModel):
+    pairs: List[DuplicatePairOut]
+
+class UserRoleOut(BaseModel):
+    role: str
+
+class RecipeImport(BaseModel):
+    # One line of an admin bulk import/export (NDJSON or CSV)
+    title: str
+    description: str = ""
+    equipment: List[str] = []
+    ingredients: List[str] = []
+    instructions: List[str] = []
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    seconds: float
+    rowsPerSecond: float
+
+class RecipeRatingSummary(BaseModel):
+    id: int
+    title: str
+    ratings: int
+    average: float
+    distribution: Dict[str, int]   # star value -> number of ratings
+
+class RatingAnalyticsOut(BaseModel):
+    recipesRated: int
+    ratings: int
+    average: float
+    distribution: Dict[str, int]
+    top: List[RecipeRatingSummary]
+    bottom: List[RecipeRatingSummary]
+
+class ReconcileReport(BaseModel):
+    recipes: int
+    drifted: int
+    driftedIds: List[int]
+    seconds: float
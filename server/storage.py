@@ -0,0 +1,186 @@
+# server/storage.py
+
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, inspect, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Where a recipe's equipment, ingredients and instructions are kept:
+#   normalized  one row each in recipe_utensils, recipe_ingredients and
+#               recipe_instructions; a detail read touches four tables
+#   document    ordered JSON arrays in recipes.document; a detail read is
+#               the recipe row alone
+# recipe_utensils is written in both modes: it is the equipment filter's
+# access path. Switching modes needs `python storage.py pack` (to document)
+# or `python storage.py unpack` (to normalized) first.
+RECIPE_STORAGE = os.getenv("RECIPE_STORAGE", "normalized")
+if RECIPE_STORAGE not in ("normalized", "document"):
+    raise RuntimeError(f"RECIPE_STORAGE must be 'normalized' or 'document', not {RECIPE_STORAGE!r}")
+DOCUMENT = RECIPE_STORAGE == "document"
+
+# Child collections of a recipe: (name, model, value column). Position in a
+# collection is its id order, which is insertion order. The names are also
+# the keys of recipes.document.
+CHILDREN = (
+    ("utensils", models.RecipeUtensil, "utensil"),
+    ("ingredients", models.RecipeIngredient, "text"),
+    ("instructions", models.RecipeInstruction, "step"),
+)
+
+# Kept as rows in both modes
+INDEXED = ("utensils",)
+
+# What a personal copy of a master recipe can override (models.Recipe.overrides)
+OVERRIDABLE = ("title", "description") + tuple(name for name, _, _ in CHILDREN)
+
+# The collections stored as rows under the current mode
+ROW_CHILDREN = tuple(c for c in CHILDREN if not DOCUMENT or c[0] in INDEXED)
+
+PACK_BATCH_SIZE = 500
+
+
+def loaders(*names: str) -> tuple:
+    """
+    Loader options that make values(recipe, name) free for each of `names`
+    (every collection when none are given): a selectinload per collection
+    of the source_* lists, which already hold a personal copy's master's
+    rows, or in document mode the recipe's own document column. The master
+    of a copy is joined into the recipe query itself, so copies cost no
+    extra queries.
+    """
+    if DOCUMENT:
+        return (undefer(models.Recipe.document), joinedload(models.Recipe.parent).undefer(models.Recipe.document))
+    names = names or tuple(name for name, _, _ in CHILDREN)
+    return tuple(selectinload(getattr(models.Recipe, "source_" + name)) for name in names) + (
+        joinedload(models.Recipe.parent),
+    )
+
+
+def _inherited(recipe: models.Recipe, name: str) -> Optional[models.Recipe]:
+    # The recipe `name` is read from: the master, for a copy not overriding it
+    if recipe.parent_id is not None and name not in (recipe.overrides or {}):
+        return recipe.parent
+    return None
+
+
+def values(recipe: models.Recipe, name: str) -> List[str]:
+    """A recipe's `name` collection ("utensils", "ingredients", "instructions"), in order."""
+    parent = _inherited(recipe, name)
+    # A copy loaded with loaders() has its master's rows in source_<name>;
+    # otherwise the master's own lists are read, shared by all its copies.
+    if parent is not None and (DOCUMENT or "source_" + name in inspect(recipe).unloaded):
+        return values(parent, name)
+    overrides = recipe.overrides or {}
+    if recipe.parent_id is not None and name in overrides:
+        return overrides[name]
+    if DOCUMENT:
+        return (recipe.document or {}).get(name) or []
+    column = next(column for n, _, column in CHILDREN if n == name)
+    return [getattr(child, column) for child in getattr(recipe, "source_" + name)]
+
+
+def field(recipe: models.Recipe, name: str) -> str:
+    """A recipe's title or description, resolved like values()."""
+    parent = _inherited(recipe, name)
+    if parent is not None:
+        return field(parent, name)
+    overrides = recipe.overrides or {}
+    if recipe.parent_id is not None and name in overrides:
+        return overrides[name]
+    return getattr(recipe, name) or ""
+
+
+def resolve(recipe: models.Recipe, name: str):
+    """Any OVERRIDABLE field of a recipe, as values() or field() reads it."""
+    return field(recipe, name) if name in ("title", "description") else values(recipe, name)
+
+
+def document(children: Dict[str, Optional[List[str]]]) -> Dict[str, List[str]]:
+    """recipes.document for the given collections; missing ones are empty."""
+    return {name: list(children.get(name) or []) for name, _, _ in CHILDREN}
+
+
+# --- Switching modes ---
+
+def _collections(db: Session, recipe_ids: List[int]) -> Dict[int, Dict[str, List[str]]]:
+    found: Dict[int, Dict[str, List[str]]] = defaultdict(dict)
+    for name, model, column in CHILDREN:
+        rows = db.execute(
+            select(model.recipe_id, getattr(model, column))
+            .where(model.recipe_id.in_(recipe_ids))
+            .order_by(model.recipe_id, model.id)
+        )
+        for recipe_id, value in rows:
+            found[recipe_id].setdefault(name, []).append(value)
+    return found
+
+
+def pack(db: Session) -> dict:
+    """
+    Rebuild every recipe's document from its child rows. Commits per batch.
+    Personal copies keep their own lists in `overrides` and are skipped.
+    """
+    started = time.perf_counter()
+    ids = list(db.scalars(
+        select(models.Recipe.id).where(models.Recipe.parent_id.is_(None)).order_by(models.Recipe.id)
+    ))
+    for start in range(0, len(ids), PACK_BATCH_SIZE):
+        batch = ids[start:start + PACK_BATCH_SIZE]
+        found = _collections(db, batch)
+        db.execute(update(models.Recipe), [{"id": i, "document": document(found.get(i, {}))} for i in batch])
+        db.commit()
+    seconds = time.perf_counter() - started
+    logger.info("Packed %d recipe documents in %.2fs", len(ids), seconds)
+    return {"recipes": len(ids), "seconds": round(seconds, 3)}
+
+
+def unpack(db: Session) -> dict:
+    """
+    Rewrite the child rows of every recipe that has a document from that
+    document. Utensil rows are kept in step in both modes and left alone.
+    Commits per batch.
+    """
+    started = time.perf_counter()
+    ids = list(db.scalars(
+        select(models.Recipe.id)
+        .where(models.Recipe.document.isnot(None), models.Recipe.parent_id.is_(None))
+        .order_by(models.Recipe.id)
+    ))
+    for start in range(0, len(ids), PACK_BATCH_SIZE):
+        batch = ids[start:start + PACK_BATCH_SIZE]
+        docs = dict(db.execute(
+            select(models.Recipe.id, models.Recipe.document).where(models.Recipe.id.in_(batch))
+        ).all())
+        for name, model, column in CHILDREN:
+            if name in INDEXED:
+                continue
+            db.execute(
+                delete(model).where(model.recipe_id.in_(batch)),
+                execution_options={"synchronize_session": False},
+            )
+            rows = [{"recipe_id": i, column: v} for i in batch for v in docs[i].get(name) or []]
+            if rows:
+                db.execute(insert(model), rows)
+        db.commit()
+    seconds = time.perf_counter() - started
+    logger.info("Unpacked %d recipe documents in %.2fs", len(ids), seconds)
+    return {"recipes": len(ids), "seconds": round(seconds, 3)}
+
+
+if __name__ == "__main__":
+    # Before switching RECIPE_STORAGE:  python storage.py pack | unpack
+    if sys.argv[1:] not in (["pack"], ["unpack"]):
+        sys.exit("usage: python storage.py pack | unpack")
+    with SessionLocal() as db:
+        print(json.dumps((pack if sys.argv[1] == "pack" else unpack)(db)))
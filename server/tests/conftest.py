@@ -0,0 +1,94 @@
+# server/tests/conftest.py
+"""
+The tests drive the API through TestClient against one scratch SQLite
+database, seeded once per session. Run from server/:
+
+    python -m pytest
+    RECIPE_STORAGE=document python -m pytest
+"""
+
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database before database.py builds its engines
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="coffee-tests-"), "tests.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import models
+import main
+import passwords
+from auth import create_access_token
+
+
+def seed() -> Dict[str, object]:
+    """
+    Two users and 40 recipes (masters and the cook's own, alternating),
+    each with equipment, ingredients, steps, notes and ratings, plus two
+    personal copies of a master.
+    """
+    with database.SessionLocal() as db:
+        admin = models.User(username="admin", hashed_password=passwords.pwd_context.hash("pw"), role="admin")
+        cook = models.User(username="cook", hashed_password=passwords.pwd_context.hash("pw"), role="user")
+        db.add_all([admin, cook])
+        db.flush()
+        db.add_all([models.UserUtensil(user_id=cook.id, utensil=u) for u in ("French Press", "Moka Pot")])
+        recipes = []
+        for i in range(40):
+            master = i % 2 == 0
+            r = models.Recipe(
+                title=f"Recipe {i}",
+                description="",
+                is_master_recipe=1 if master else 0,
+                user_id=admin.id if master else cook.id,
+            )
+            r.utensils = [models.RecipeUtensil(utensil=["French Press", "Moka Pot", "Cold Brew"][i % 3])]
+            r.ingredients = [models.RecipeIngredient(text=f"{i} g coffee"), models.RecipeIngredient(text="water")]
+            r.instructions = [models.RecipeInstruction(step=f"step {n} of recipe {i}") for n in range(3)]
+            # both layouts, so the tests run under either RECIPE_STORAGE
+            r.document = {
+                "utensils": [u.utensil for u in r.utensils],
+                "ingredients": [x.text for x in r.ingredients],
+                "instructions": [x.step for x in r.instructions],
+            }
+            r.notes = [models.Note(user_id=cook.id, content=f"note {n}") for n in range(2)]
+            r.ratings = [models.Rating(user_id=cook.id, rating=i % 5 + 1), models.Rating(user_id=admin.id, rating=3)]
+            recipes.append(r)
+        db.add_all(recipes)
+        db.commit()
+        # personal copies of a master, changing only their title
+        parent = recipes[18]
+        copies = [
+            models.Recipe(title=f"Copy {n}", description="", is_master_recipe=0, user_id=cook.id,
+                          parent_id=parent.id, overrides={"title": f"Copy {n}"})
+            for n in range(2)
+        ]
+        db.add_all(copies)
+        db.commit()
+        return {
+            "notes": {r.id: [n.id for n in r.notes] for r in recipes},
+            "admin": {"Authorization": f"Bearer {create_access_token(admin)}"},
+            "cook": {"Authorization": f"Bearer {create_access_token(cook)}"},
+            "master": [r.id for r in recipes if r.is_master_recipe],
+            "personal": [r.id for r in recipes if not r.is_master_recipe],
+            "copies": [r.id for r in copies],
+        }
+
+
+@pytest.fixture(scope="session")
+def seeded() -> Dict[str, object]:
+    return seed()
+
+
+@pytest.fixture(scope="session")
+def client(seeded) -> TestClient:
+    return TestClient(main.app)
@@ -0,0 +1,38 @@
+# server/tests/test_compression.py
+"""
+Compressed catalog pages are cached per content key. The caller's
+ratings and notes are spliced into every page, so two users asking for
+the same page must never be served one compressed body.
+"""
+
+import orjson
+import pytest
+
+import compression
+
+BR = {"Accept-Encoding": "br"}
+
+
+@pytest.mark.skipif(compression.brotli is None, reason="brotli is not installed")
+def test_same_page_different_users(client, seeded):
+    recipe_id = seeded["master"][10]
+    for user, rating in (("cook", 5), ("admin", 1)):
+        response = client.post(f"/recipies/{recipe_id}/rating", json={"rating": rating}, headers=seeded[user])
+        assert response.status_code == 200
+
+    page = {"limit": 15}
+    bodies = {}
+    for user in ("cook", "admin", "cook"):
+        response = client.get("/master/recipies", params=page, headers={**seeded[user], **BR})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "br"
+        bodies.setdefault(user, response.content)
+        # the cached compression of one user's page is never handed to another
+        assert response.content == bodies[user]
+
+    assert bodies["cook"] != bodies["admin"]
+    ratings = {
+        user: next(r["userRating"] for r in orjson.loads(body) if r["id"] == recipe_id)
+        for user, body in bodies.items()
+    }
+    assert ratings == {"cook": 5, "admin": 1}
@@ -0,0 +1,72 @@
+# server/tests/test_copies.py
+"""
+Personal copies of master recipes (POST /recipies/{id}/clone): what a
+copy inherits from its master and what it overrides.
+"""
+
+from typing import Dict, List
+
+MASTER = {"Title": "Siphon", "Description": "", "Utensils": [{"Utensil": "Siphon"}], "Recipie": "a\nb", "Ingredients": ["x"]}
+
+
+def new_master(client, seeded) -> int:
+    response = client.post("/admin/recipes", json=MASTER, headers=seeded["admin"])
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def clone(client, seeded, master_id: int, **changes) -> int:
+    response = client.post(f"/recipies/{master_id}/clone", json={**MASTER, **changes}, headers=seeded["cook"])
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def listed(client, seeded, equipment: str) -> List[int]:
+    response = client.get("/recipies", params={"equipment": equipment}, headers=seeded["cook"])
+    assert response.status_code == 200, response.text
+    return [r["id"] for r in response.json()["recipes"]]
+
+
+def detail(client, seeded, recipe_id: int) -> Dict:
+    response = client.get(f"/recipie/{recipe_id}", headers=seeded["cook"])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_equipment_filter_follows_overrides(client, seeded):
+    master_id = new_master(client, seeded)
+    inherits = clone(client, seeded, master_id, Title="Inherits")
+    emptied = clone(client, seeded, master_id, Title="No equipment", Utensils=[])
+    moved = clone(client, seeded, master_id, Title="Own equipment", Utensils=[{"Utensil": "Pour Over"}])
+
+    assert detail(client, seeded, inherits)["equipment"] == ["Siphon"]
+    assert detail(client, seeded, emptied)["equipment"] == []
+    assert detail(client, seeded, moved)["equipment"] == ["Pour Over"]
+
+    # an empty override lists no equipment, so it never matches through the master's
+    siphon = listed(client, seeded, "Siphon")
+    assert inherits in siphon
+    assert emptied not in siphon
+    assert moved not in siphon
+    assert moved in listed(client, seeded, "Pour Over")
+
+
+def test_admin_update_promotes_a_copy(client, seeded):
+    master_id = new_master(client, seeded)
+    copy_id = clone(client, seeded, master_id, Title="Promoted", Ingredients=["y", "z"])
+
+    changed = {**MASTER, "Title": "Promoted", "Ingredients": ["y", "z"], "Recipie": "a\nb\nc"}
+    response = client.put(f"/admin/recipes/{copy_id}", json=changed, headers=seeded["admin"])
+    assert response.status_code == 200, response.text
+
+    promoted = detail(client, seeded, copy_id)
+    assert promoted["isMasterRecipe"] is True
+    assert promoted["parentId"] is None and promoted["overrides"] == []
+    assert (promoted["title"], promoted["equipment"], promoted["ingredients"], promoted["instructions"]) == (
+        "Promoted", ["Siphon"], ["y", "z"], ["a", "b", "c"]
+    )
+    # its lists are its own rows now: a copy of it reads them, not the old master's
+    grandchild = clone(client, seeded, copy_id, **changed)
+    assert detail(client, seeded, grandchild)["ingredients"] == ["y", "z"]
+    assert detail(client, seeded, grandchild)["instructions"] == ["a", "b", "c"]
+    assert detail(client, seeded, master_id)["ingredients"] == ["x"]
@@ -0,0 +1,89 @@
+# server/tests/test_dedupe.py
+"""
+MinHash/LSH duplicate detection: near-identical recipes are grouped,
+distinct ones are not, and edits are picked up through touch().
+"""
+
+from typing import Dict, List
+
+from dedupe import shingles, signature, similarity
+
+STEPS = [
+    "grind eighteen grams of coffee to a fine espresso grind",
+    "distribute and tamp the grounds evenly in the portafilter basket",
+    "lock the portafilter into the group head and start the shot",
+    "pull thirty six grams of espresso in about twenty eight seconds",
+    "steam the milk to sixty five degrees and pour it over the shot",
+]
+INGREDIENTS = ["18 g finely ground espresso roast", "36 g water through the puck", "150 ml whole milk"]
+
+ESPRESSO = {"Title": "Classic cafe latte", "Description": "", "Utensils": [{"Utensil": "Espresso Machine"}],
+            "Recipie": "\n".join(STEPS), "Ingredients": INGREDIENTS}
+# one word changed
+NEAR = {**ESPRESSO, "Recipie": "\n".join(STEPS[:-1] + [STEPS[-1].replace("sixty five", "sixty")])}
+COLD_BREW = {
+    "Title": "Overnight cold brew concentrate", "Description": "", "Utensils": [{"Utensil": "Mason Jar"}],
+    "Recipie": "\n".join([
+        "coarsely grind one hundred grams of dark roast beans",
+        "stir the grounds into a litre of cold filtered water",
+        "cover the jar and steep in the fridge for eighteen hours",
+        "strain twice through a paper filter and dilute to taste",
+    ]),
+    "Ingredients": ["100 g coarse dark roast", "1 l cold filtered water", "ice cubes"],
+}
+
+
+def test_signature_similarity_estimates_jaccard():
+    a = shingles("t", [], [" ".join(f"w{i}" for i in range(60))])
+    b = shingles("t", [], [" ".join(f"w{i}" for i in range(10, 70))])
+    exact = len(a & b) / len(a | b)
+    assert abs(similarity(signature(a), signature(b)) - exact) < 0.15
+    assert similarity(signature(a), signature(a)) == 1.0
+
+
+def create(client, seeded, body: Dict) -> int:
+    response = client.post("/admin/recipes", json=body, headers=seeded["admin"])
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def duplicates_of(client, seeded, recipe_id: int) -> List[int]:
+    response = client.get(f"/admin/recipes/{recipe_id}/duplicates", headers=seeded["admin"])
+    assert response.status_code == 200, response.text
+    return [d["id"] for d in response.json()["duplicates"]]
+
+
+def test_near_identical_recipes_are_grouped(client, seeded):
+    latte, near, cold = (create(client, seeded, body) for body in (ESPRESSO, NEAR, COLD_BREW))
+    # other tests create the same recipes: only this test's count
+    mine = {latte, near, cold}
+    assert [d for d in duplicates_of(client, seeded, latte) if d in mine] == [near]
+    assert [d for d in duplicates_of(client, seeded, near) if d in mine] == [latte]
+    assert not mine & set(duplicates_of(client, seeded, cold))
+
+    response = client.get("/admin/recipes/duplicates", headers=seeded["admin"])
+    pairs = {(p["recipe"]["id"], p["duplicate"]["id"]) for p in response.json()["pairs"]}
+    assert (latte, near) in pairs
+    assert not {(latte, cold), (near, cold)} & pairs
+
+
+def test_updates_are_picked_up(client, seeded):
+    latte, cold = create(client, seeded, ESPRESSO), create(client, seeded, COLD_BREW)
+    assert cold not in duplicates_of(client, seeded, latte)
+
+    # the cold brew is rewritten into the latte: touch() re-hashes it
+    response = client.put(f"/admin/recipes/{cold}", json=NEAR, headers=seeded["admin"])
+    assert response.status_code == 200, response.text
+    assert cold in duplicates_of(client, seeded, latte)
+    assert latte in duplicates_of(client, seeded, cold)
+
+    # and back: no longer a duplicate
+    client.put(f"/admin/recipes/{cold}", json=COLD_BREW, headers=seeded["admin"])
+    assert cold not in duplicates_of(client, seeded, latte)
+    assert latte not in duplicates_of(client, seeded, cold)
+
+    # a deleted recipe drops out
+    client.put(f"/admin/recipes/{cold}", json=ESPRESSO, headers=seeded["admin"])
+    assert cold in duplicates_of(client, seeded, latte)
+    assert client.delete(f"/admin/recipes/{cold}", headers=seeded["admin"]).status_code == 200
+    assert cold not in duplicates_of(client, seeded, latte)
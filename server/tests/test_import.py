@@ -0,0 +1,37 @@
+# server/tests/test_import.py
+"""
+POST /admin/recipes/import reports bad rows by line and loads the rest.
+"""
+
+import json
+
+BAD_UTF8 = b'{"title": "Caf\xe9"}'
+
+
+def ndjson(*rows) -> bytes:
+    return b"\n".join(row if isinstance(row, bytes) else json.dumps(row).encode() for row in rows) + b"\n"
+
+
+def test_ndjson_bad_bytes_fail_only_their_line(client, seeded):
+    body = ndjson({"title": "Import A", "equipment": ["Siphon"]}, BAD_UTF8, {"title": "Import B"})
+    response = client.post("/admin/recipes/import", content=body, headers=seeded["admin"])
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (2, 1)
+    assert [e["line"] for e in report["errors"]] == [2]
+    assert "utf-8" in report["errors"][0]["error"]
+
+
+def test_csv_bad_bytes_fail_only_their_record(client, seeded):
+    body = b"\n".join([
+        b"title,description,equipment,ingredients,instructions",
+        b'Import C,,"[""Siphon""]",[],[]',
+        b"Caf\xe9,,[],[],[]",
+        b"Import D,,[],[],[]",
+    ])
+    headers = {**seeded["admin"], "Content-Type": "text/csv"}
+    response = client.post("/admin/recipes/import", content=body, headers=headers)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (2, 1)
+    assert [e["line"] for e in report["errors"]] == [3]
@@ -0,0 +1,100 @@
+# server/tests/test_patch.py
+"""
+PATCH /recipies/{id} diffs each child list position by position. Run
+under both RECIPE_STORAGE modes (see conftest.py).
+"""
+
+from typing import List, Tuple
+
+import pytest
+
+BODY = {
+    "Title": "Patched",
+    "Description": "",
+    "Utensils": [{"Utensil": "Kettle"}, {"Utensil": "Scale"}, {"Utensil": "Grinder"}],
+    "Recipie": "grind\nbloom\npour",
+    "Ingredients": ["18 g coffee", "300 g water"],
+}
+
+
+def lists(client, seeded, recipe_id: int) -> Tuple[List[str], List[str], List[str]]:
+    response = client.get(f"/recipie/{recipe_id}", headers=seeded["cook"])
+    assert response.status_code == 200, response.text
+    r = response.json()
+    return r["equipment"], r["ingredients"], r["instructions"]
+
+
+def with_equipment(client, seeded, utensil: str) -> List[int]:
+    # the equipment filter reads recipe_utensils rows, kept in step in both modes
+    response = client.get("/recipies", params={"equipment": utensil}, headers=seeded["cook"])
+    assert response.status_code == 200, response.text
+    return [r["id"] for r in response.json()["recipes"]]
+
+
+@pytest.fixture
+def recipe_id(client, seeded) -> int:
+    response = client.post("/recipies", json=BODY, headers=seeded["cook"])
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def patch(client, seeded, recipe_id: int, **fields) -> List[str]:
+    response = client.patch(f"/recipies/{recipe_id}", json=fields, headers=seeded["cook"])
+    assert response.status_code == 200, response.text
+    return response.json()["changed"]
+
+
+def test_changed_rows(client, seeded, recipe_id):
+    changed = patch(
+        client, seeded, recipe_id,
+        Utensils=[{"Utensil": "Kettle"}, {"Utensil": "Gooseneck"}, {"Utensil": "Grinder"}],
+        Ingredients=["20 g coffee", "300 g water"],
+        Recipie="grind\nbloom\nswirl",
+    )
+    assert sorted(changed) == ["ingredients", "instructions", "utensils"]
+    assert lists(client, seeded, recipe_id) == (
+        ["Kettle", "Gooseneck", "Grinder"], ["20 g coffee", "300 g water"], ["grind", "bloom", "swirl"]
+    )
+    assert recipe_id in with_equipment(client, seeded, "Gooseneck")
+
+
+def test_appended_rows(client, seeded, recipe_id):
+    patch(
+        client, seeded, recipe_id,
+        Utensils=[{"Utensil": "Kettle"}, {"Utensil": "Scale"}, {"Utensil": "Grinder"}, {"Utensil": "Timer"}],
+        Ingredients=["18 g coffee", "300 g water", "ice"],
+        Recipie="grind\nbloom\npour\nstir\nserve",
+    )
+    assert lists(client, seeded, recipe_id) == (
+        ["Kettle", "Scale", "Grinder", "Timer"],
+        ["18 g coffee", "300 g water", "ice"],
+        ["grind", "bloom", "pour", "stir", "serve"],
+    )
+
+
+def test_removed_rows(client, seeded, recipe_id):
+    patch(client, seeded, recipe_id, Utensils=[{"Utensil": "Scale"}], Ingredients=[], Recipie="grind\nbloom")
+    assert lists(client, seeded, recipe_id) == (["Scale"], [], ["grind", "bloom"])
+    assert recipe_id not in with_equipment(client, seeded, "Grinder")
+
+
+def test_changed_appended_and_removed_together(client, seeded, recipe_id):
+    patch(
+        client, seeded, recipe_id,
+        Utensils=[{"Utensil": "Grinder"}, {"Utensil": "Kettle"}],
+        Ingredients=["18 g coffee", "250 g water", "milk", "sugar"],
+        Recipie="pour",
+    )
+    assert lists(client, seeded, recipe_id) == (
+        ["Grinder", "Kettle"], ["18 g coffee", "250 g water", "milk", "sugar"], ["pour"]
+    )
+    # a second patch starts from the stored lists, not the original ones
+    patch(client, seeded, recipe_id, Ingredients=["18 g coffee"])
+    assert lists(client, seeded, recipe_id) == (["Grinder", "Kettle"], ["18 g coffee"], ["pour"])
+
+
+def test_unsent_and_unchanged_lists_are_left_alone(client, seeded, recipe_id):
+    assert patch(client, seeded, recipe_id, Title="Renamed", Ingredients=["18 g coffee", "300 g water"]) == ["title"]
+    assert lists(client, seeded, recipe_id) == (
+        ["Kettle", "Scale", "Grinder"], ["18 g coffee", "300 g water"], ["grind", "bloom", "pour"]
+    )
@@ -0,0 +1,196 @@
+# server/tests/test_query_plans.py
+"""
+Query-plan regression tests, one per access path. Each drives an endpoint
+against the seeded database and runs EXPLAIN QUERY PLAN on every statement
+it issues. A full scan of a stored table the path isn't expected to make
+(a dropped or unusable index) fails the test, and so does a path issuing
+more statements than its budget (a new lazy load).
+
+The paths run in order against shared data: later ones read what earlier
+ones wrote, and the writes come after the reads they would disturb.
+"""
+
+import sqlite3
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import database
+import models
+from catalog import bump_catalog
+from conftest import DB_PATH
+
+# Statement kinds whose plans are checked (plain INSERT ... VALUES has none)
+PLANNED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+BODY = {"Title": "New", "Description": "", "Utensils": [{"Utensil": "Moka Pot"}], "Recipie": "a\nb", "Ingredients": ["x"]}
+
+
+class Check(NamedTuple):
+    name: str
+    # (client, seeded data) -> response
+    request: Callable[[TestClient, dict], object]
+    # tables the endpoint reads in full by design
+    allow_scans: Set[str] = frozenset()
+    # call once before the checked call (builds caches / models)
+    warm_up: bool = False
+    # run before the checked call, outside the statement count
+    before: Optional[Callable[[], None]] = None
+    # most SQL statements the call may issue
+    max_statements: Optional[int] = None
+
+
+class Statements:
+    """Every statement sent through either engine while recording."""
+
+    def __init__(self):
+        self.recording = False
+        self.seen: List[Tuple[str, tuple]] = []
+        for engine in (database.engine, database.async_engine.sync_engine):
+            event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.recording:
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            self.seen.append((statement, tuple(parameters or ())))
+
+    def capture(self, fn: Callable[[], object]) -> List[Tuple[str, tuple]]:
+        self.seen, self.recording = [], True
+        try:
+            fn()
+        finally:
+            self.recording = False
+        return self.seen
+
+
+def full_scans(plans: sqlite3.Connection, statement: str, parameters: tuple) -> Tuple[List[str], List[str]]:
+    """
+    (plan lines, tables read by a full table or index scan). Scans of a
+    statement's own subqueries and CTEs are only as big as what was
+    searched to build them, so just stored tables count.
+    """
+    lines = [row[3] for row in plans.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+    scanned = [
+        line.split()[1] for line in lines
+        if line.startswith("SCAN ") and line.split()[1] in models.Base.metadata.tables
+    ]
+    return lines, scanned
+
+
+def new_catalog_version():
+    with database.SessionLocal() as db:
+        bump_catalog(db)
+        db.commit()
+
+
+def master(s: Dict, i: int) -> int:
+    return s["master"][i]
+
+
+def personal(s: Dict, i: int) -> int:
+    return s["personal"][i]
+
+
+CHECKS = [
+    Check("POST /login", lambda c, s: c.post("/login", json={"Username": "cook", "Password": "pw"}), max_statements=1),
+    Check("GET /users/{u}/equipment", lambda c, s: c.get("/users/cook/equipment", headers=s["cook"]), max_statements=1),
+    Check("GET /master/recipies (catalog build)",
+          lambda c, s: c.get("/master/recipies", headers=s["cook"]), before=new_catalog_version, max_statements=5),
+    Check("GET /master/recipies?equipment= (catalog build)",
+          lambda c, s: c.get("/master/recipies", params={"equipment": "Moka Pot", "limit": 5}, headers=s["cook"]),
+          before=new_catalog_version, max_statements=5),
+    Check("GET /master/recipies (cached)",
+          lambda c, s: c.get("/master/recipies", params={"limit": 5}, headers=s["cook"]), warm_up=True, max_statements=1),
+    Check("GET /recipies",
+          lambda c, s: c.get("/recipies", params={"limit": 5, "after": personal(s, 2)}, headers=s["cook"]),
+          max_statements=5),
+    # matches the copies through their master's equipment; their masters' lists come in the same queries
+    Check("GET /recipies?equipment=",
+          lambda c, s: c.get("/recipies", params={"equipment": "French Press"}, headers=s["cook"]), max_statements=5),
+    Check("GET /recipie/{personal}", lambda c, s: c.get(f"/recipie/{personal(s, 0)}", headers=s["cook"]), max_statements=5),
+    Check("GET /recipie/{master} (cached)",
+          lambda c, s: c.get(f"/recipie/{master(s, 0)}", headers=s["cook"]), warm_up=True, max_statements=1),
+    # a copy costs what any personal recipe does
+    Check("GET /recipie/{copy}", lambda c, s: c.get(f"/recipie/{s['copies'][0]}", headers=s["cook"]), max_statements=5),
+    Check("POST /recipies", lambda c, s: c.post("/recipies", json=BODY, headers=s["cook"]), max_statements=4),
+    Check("PUT /recipies/{id}", lambda c, s: c.put(f"/recipies/{personal(s, 1)}", json=BODY, headers=s["cook"]), max_statements=10),
+    Check("PUT /recipies/{copy}", lambda c, s: c.put(f"/recipies/{s['copies'][1]}", json=BODY, headers=s["cook"]), max_statements=8),
+    Check("PATCH /recipies/{id}",
+          lambda c, s: c.patch(f"/recipies/{personal(s, 2)}", json={"Title": "P", "Ingredients": ["y"]}, headers=s["cook"]),
+          max_statements=5),
+    Check("POST /recipies/{id}/rating",
+          lambda c, s: c.post(f"/recipies/{master(s, 1)}/rating", json={"rating": 5}, headers=s["cook"]), max_statements=6),
+    Check("POST /recipies/batch", lambda c, s: c.post("/recipies/batch", json={
+        "ratings": [{"recipeId": master(s, 2), "rating": 1}, {"recipeId": master(s, 3), "rating": 2}],
+        "notes": [{"recipeId": master(s, 2), "note": "n"}],
+        "deletedNotes": [{"recipeId": master(s, 3), "id": s["notes"][master(s, 3)][0]}],
+    }, headers=s["cook"]), max_statements=9),
+    Check("GET /recipies/{id}/notes",
+          lambda c, s: c.get(f"/recipies/{master(s, 8)}/notes",
+                             params={"limit": 1, "before": s["notes"][master(s, 8)][1]}, headers=s["cook"]),
+          max_statements=2),
+    Check("POST /recipies/{id}/notes",
+          lambda c, s: c.post(f"/recipies/{master(s, 8)}/notes", json={"note": "n"}, headers=s["cook"]), max_statements=2),
+    Check("DELETE /recipies/{id}/notes/{note_id}",
+          lambda c, s: c.delete(f"/recipies/{master(s, 8)}/notes/{s['notes'][master(s, 8)][0]}", headers=s["cook"]),
+          max_statements=1),
+    # reads the master to store only what the copy changes
+    Check("POST /recipies/{id}/clone",
+          lambda c, s: c.post(f"/recipies/{master(s, 4)}/clone", json=BODY, headers=s["cook"]), max_statements=6),
+    Check("DELETE /recipies/{id}", lambda c, s: c.delete(f"/recipies/{personal(s, 3)}", headers=s["cook"]), max_statements=13),
+    Check("GET /users/{u}/recommendations",
+          lambda c, s: c.get("/users/cook/recommendations", headers=s["cook"]),
+          # the cold-start fallback ranks every recipe's aggregates
+          allow_scans={"recipe_rating_stats"}, warm_up=True, max_statements=2),
+    Check("GET /admin/recipes", lambda c, s: c.get("/admin/recipes", headers=s["admin"]), max_statements=6),
+    Check("GET /admin/ratings/analytics", lambda c, s: c.get("/admin/ratings/analytics", headers=s["admin"]),
+          allow_scans={"recipe_rating_stats"}, max_statements=3),
+    Check("GET /admin/recipes/{id}/duplicates",
+          lambda c, s: c.get(f"/admin/recipes/{master(s, 5)}/duplicates", headers=s["admin"]), warm_up=True,
+          max_statements=1),
+    Check("POST /admin/recipes", lambda c, s: c.post("/admin/recipes", json=BODY, headers=s["admin"]), max_statements=5),
+    Check("PUT /admin/recipes/{id}",
+          lambda c, s: c.put(f"/admin/recipes/{master(s, 6)}", json=BODY, headers=s["admin"]), max_statements=12),
+    # both also look up the master's personal copies
+    Check("DELETE /admin/recipes/{id}",
+          lambda c, s: c.delete(f"/admin/recipes/{master(s, 7)}", headers=s["admin"]), max_statements=15),
+]
+
+
+@pytest.fixture(scope="module")
+def statements() -> Statements:
+    return Statements()
+
+
+@pytest.fixture(scope="module")
+def plans() -> sqlite3.Connection:
+    return sqlite3.connect(DB_PATH)
+
+
+@pytest.mark.parametrize("check", CHECKS, ids=[c.name for c in CHECKS])
+def test_access_path(check: Check, client, seeded, statements, plans):
+    if check.warm_up:
+        check.request(client, seeded)
+    if check.before:
+        check.before()
+    responses = []
+    seen = statements.capture(lambda: responses.append(check.request(client, seeded)))
+    assert responses[0].status_code < 400, responses[0].text
+
+    problems = []
+    for statement, parameters in seen:
+        if not statement.lstrip().upper().startswith(PLANNED):
+            continue
+        lines, scanned = full_scans(plans, statement, parameters)
+        bad = [t for t in scanned if t not in check.allow_scans]
+        if bad:
+            problems.append(f"full scan of {', '.join(bad)}: {' '.join(statement.split())[:160]}\n    " + "\n    ".join(lines))
+    assert not problems, "\n".join(problems)
+    if check.max_statements is not None:
+        assert len(seen) <= check.max_statements, (
+            f"{len(seen)} statements, budget is {check.max_statements}:\n"
+            + "\n".join(" ".join(statement.split())[:160] for statement, _ in seen)
+        )
@@ -0,0 +1,104 @@
+# server/tests/test_ratings.py
+"""
+Rating writes keep recipe_rating_stats in step incrementally; reconcile()
+recomputes the same figures from the ratings themselves.
+"""
+
+from typing import Dict, List, Tuple
+
+import pytest
+from sqlalchemy import select
+
+import database
+import ratings
+
+RECIPE = {"Title": "Rated", "Description": "", "Utensils": [], "Recipie": "a", "Ingredients": []}
+
+
+def stats(recipe_ids: List[int]) -> Dict[int, Tuple[int, ...]]:
+    """recipe id -> (count, total, stars_1 .. stars_5) as stored."""
+    Stats = ratings.Stats
+    with database.SessionLocal() as db:
+        rows = db.execute(select(Stats.recipe_id, *ratings.STAT_COLUMNS).where(Stats.recipe_id.in_(recipe_ids)))
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def reconcile() -> dict:
+    with database.SessionLocal() as db:
+        return ratings.reconcile(db)
+
+
+@pytest.fixture
+def recipes(client, seeded) -> List[int]:
+    # the seed writes ratings without their aggregates: start from true figures
+    reconcile()
+    ids = []
+    for _ in range(3):
+        response = client.post("/admin/recipes", json=RECIPE, headers=seeded["admin"])
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def rate(client, seeded, user: str, recipe_id: int, stars: int):
+    response = client.post(f"/recipies/{recipe_id}/rating", json={"rating": stars}, headers=seeded[user])
+    assert response.status_code == 200, response.text
+
+
+def batch(client, seeded, user: str, changes: Dict[int, int]) -> int:
+    body = {"ratings": [{"recipeId": recipe_id, "rating": stars} for recipe_id, stars in changes.items()]}
+    response = client.post("/recipies/batch", json=body, headers=seeded[user])
+    assert response.status_code == 200, response.text
+    return response.json()["ratings"]
+
+
+def test_first_rating_creates_the_stats_row(client, seeded, recipes):
+    first = recipes[0]
+    assert stats([first]) == {}
+    rate(client, seeded, "cook", first, 4)
+    assert stats([first]) == {first: (1, 4, 0, 0, 0, 1, 0)}
+    assert reconcile()["drifted"] == 0
+
+
+def test_rerating_moves_the_star(client, seeded, recipes):
+    first = recipes[0]
+    rate(client, seeded, "cook", first, 4)
+    rate(client, seeded, "admin", first, 2)
+    rate(client, seeded, "cook", first, 5)
+    # the cook's 4 is gone, their 5 counted once, the admin's 2 untouched
+    assert stats([first]) == {first: (2, 7, 0, 1, 0, 0, 1)}
+    # the same rating again writes nothing
+    rate(client, seeded, "cook", first, 5)
+    assert stats([first]) == {first: (2, 7, 0, 1, 0, 0, 1)}
+    assert reconcile()["drifted"] == 0
+
+
+def test_batch_ratings(client, seeded, recipes):
+    a, b, c = recipes
+    rate(client, seeded, "cook", a, 1)
+    # a re-rating, a first rating, a repeat of the same value and a later
+    # change of the same recipe in one request
+    assert batch(client, seeded, "cook", {a: 3, b: 5}) == 2
+    assert batch(client, seeded, "cook", {b: 5, c: 2}) == 1
+    body = {"ratings": [{"recipeId": c, "rating": 1}, {"recipeId": c, "rating": 4}]}
+    assert client.post("/recipies/batch", json=body, headers=seeded["cook"]).json()["ratings"] == 1
+
+    assert stats(recipes) == {
+        a: (1, 3, 0, 0, 1, 0, 0),
+        b: (1, 5, 0, 0, 0, 0, 1),
+        c: (1, 4, 0, 0, 0, 1, 0),
+    }
+    assert reconcile()["drifted"] == 0
+
+
+def test_reconcile_repairs_drift(client, seeded, recipes):
+    first = recipes[0]
+    rate(client, seeded, "cook", first, 3)
+    with database.SessionLocal() as db:
+        ratings.record(db, first, added=[5])  # an increment with no rating behind it
+        db.commit()
+    assert stats([first]) == {first: (2, 8, 0, 0, 1, 0, 1)}
+
+    report = reconcile()
+    assert report["drifted"] == 1 and report["driftedIds"] == [first]
+    assert stats([first]) == {first: (1, 3, 0, 0, 1, 0, 0)}
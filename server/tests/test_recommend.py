@@ -0,0 +1,104 @@
+# server/tests/test_recommend.py
+"""
+Item-item recommendations: the model's ranking on a small set of known
+co-ratings, its incremental updates, and the popular fallback for users
+with nothing to go on.
+"""
+
+from typing import Dict, List, Tuple
+
+import pytest
+
+import database
+import models
+import ratings
+from auth import create_access_token
+from recommend import _Model, popular
+
+# (user, recipe, stars). Recipes 1 and 2 were rated the same by the same
+# users; 3 and 4 share user 3. User 9 rated 1 and 3; recipe 5 has one
+# rater and no co-ratings, recipe 6 none at all.
+RATINGS = [
+    (1, 1, 5), (2, 1, 4), (1, 2, 5), (2, 2, 4),
+    (3, 3, 5), (1, 4, 1), (3, 4, 5), (4, 5, 3),
+    (9, 1, 5), (9, 3, 2),
+]
+RECIPES = range(1, 7)
+
+
+def ranked(model: _Model, user_id: int) -> List[int]:
+    return [recipe_id for recipe_id, _ in model.predict(user_id, 10)]
+
+
+def test_ranking_follows_co_ratings():
+    model = _Model(3, RATINGS, RECIPES)
+    predictions = model.predict(9, 10)
+    # 2 is only similar to 1, which user 9 gave 5 stars; 4 mixes 1 and 3 (2 stars)
+    assert [r for r, _ in predictions] == [2, 4]
+    assert predictions[0][1] == pytest.approx(5.0)
+    assert 2.0 < predictions[1][1] < 5.0
+
+
+def test_rated_and_removed_recipes_are_not_recommended():
+    model = _Model(3, RATINGS, RECIPES)
+    assert not {1, 3} & set(ranked(model, 9))
+    model.remove_recipe(2)
+    assert ranked(model, 9) == [4]
+
+
+def test_no_ratings_no_predictions():
+    model = _Model(3, RATINGS, RECIPES)
+    assert model.predict(42, 10) == []
+
+
+def test_incremental_update_matches_a_rebuild():
+    changes: Dict[Tuple[int, int], int] = {(9, 5): 4, (4, 6): 5, (1, 3): 2}
+    model = _Model(3, RATINGS, RECIPES)
+    model.apply(changes)
+    rebuilt = _Model(3, RATINGS + [(u, r, v) for (u, r), v in changes.items()], RECIPES)
+    for user_id in (1, 2, 3, 4, 9):
+        assert model.predict(user_id, 10) == pytest.approx(rebuilt.predict(user_id, 10))
+
+
+@pytest.fixture
+def cold_start(client, seeded) -> Dict[str, object]:
+    """A master recipe rated 5 by three raters, and a user who has rated nothing."""
+    response = client.post(
+        "/admin/recipes",
+        json={"Title": "Crowd pleaser", "Description": "", "Utensils": [], "Recipie": "a", "Ingredients": []},
+        headers=seeded["admin"],
+    )
+    recipe_id = response.json()["id"]
+    with database.SessionLocal() as db:
+        raters = [models.User(username=f"rater-{recipe_id}-{n}", hashed_password="-") for n in range(3)]
+        newcomer = models.User(username=f"newcomer-{recipe_id}", hashed_password="-")
+        db.add_all([*raters, newcomer])
+        db.flush()
+        for rater in raters:
+            ratings.save(db, rater.id, {recipe_id: 5})
+        db.commit()
+        return {
+            "recipe": recipe_id,
+            "username": newcomer.username,
+            "headers": {"Authorization": f"Bearer {create_access_token(newcomer)}"},
+        }
+
+
+def recommended(client, cold_start) -> List[dict]:
+    response = client.get(
+        f"/users/{cold_start['username']}/recommendations", params={"limit": 5}, headers=cold_start["headers"]
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["recipes"]
+
+
+def test_cold_start_falls_back_to_popular(client, seeded, cold_start):
+    picks = recommended(client, cold_start)
+    assert {p["reason"] for p in picks} == {"popular"}
+    with database.SessionLocal() as db:
+        assert [p["id"] for p in picks] == [r for r, _ in popular(db, 5)]
+    assert cold_start["recipe"] in [p["id"] for p in picks]
+
+    # once rated, it is no longer offered
+    client.post(f"/recipies/{cold_start['recipe']}/rating", json={"rating": 4}, headers=cold_start["headers"])
+    assert cold_start["recipe"] not in [p["id"] for p in recommended(client, cold_start)]
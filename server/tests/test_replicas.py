@@ -0,0 +1,75 @@
+# server/tests/test_replicas.py
+"""
+Read routing across replicas: reads go to a healthy replica, except a
+user's own reads for REPLICA_STICKY_SECONDS after they write, which
+stay on the primary.
+"""
+
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+import database
+import models
+from conftest import DB_PATH
+
+BODY = {"Title": "Fresh", "Description": "", "Utensils": [], "Recipie": "a", "Ingredients": []}
+
+
+def wait_until_checked(replica_set: database.ReplicaSet, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not all(r.checked_at for r in replica_set.replicas):
+        assert time.monotonic() < deadline, "replica health check never finished"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def replica_set(monkeypatch) -> database.ReplicaSet:
+    """A ReplicaSet over one empty replica, in place of the app's."""
+    path = os.path.join(os.path.dirname(DB_PATH), "replica.db")
+    if os.path.exists(path):
+        os.remove(path)
+    url = f"sqlite:///{path}"
+    models.Base.metadata.create_all(create_engine(url))
+    replica_set = database.ReplicaSet([url], sticky_seconds=60, check_seconds=3600)
+    monkeypatch.setattr(database, "replicas", replica_set)
+    return replica_set
+
+
+def test_first_check_runs_off_the_request(replica_set, monkeypatch):
+    checking = []
+    started = time.monotonic()
+    monkeypatch.setattr(database.Replica, "check", lambda self: (checking.append(1), time.sleep(0.5)))
+    # the first read doesn't wait for the check; until it passes, the primary serves
+    assert replica_set.pick(1) is None
+    assert time.monotonic() - started < 0.5
+    time.sleep(0.05)
+    assert checking == [1]
+
+
+def test_writer_reads_from_the_primary_while_sticky(client, seeded, replica_set):
+    assert replica_set.pick() is None  # starts the first check
+    wait_until_checked(replica_set)
+    assert replica_set.replicas[0].healthy
+
+    # before writing, the cook's reads go to the (empty) replica
+    response = client.get("/recipies", headers=seeded["cook"])
+    assert response.json()["recipes"] == []
+
+    response = client.post("/recipies", json=BODY, headers=seeded["cook"])
+    assert response.status_code == 201, response.text
+    recipe_id = response.json()["id"]
+
+    # within the sticky window the cook sees their write, on the primary
+    assert client.get(f"/recipie/{recipe_id}", headers=seeded["cook"]).status_code == 200
+    assert recipe_id in [r["id"] for r in client.get("/recipies", headers=seeded["cook"]).json()["recipes"]]
+    assert replica_set.stats()["stickyReads"] == 2
+    # someone who didn't write still reads from the replica
+    assert client.get("/admin/recipes", headers=seeded["admin"]).json() == []
+
+    # once the window is over, the cook is back on the replica
+    replica_set.sticky_seconds = 0
+    client.post(f"/recipies/{recipe_id}/rating", json={"rating": 3}, headers=seeded["cook"])
+    assert client.get("/recipies", headers=seeded["cook"]).json()["recipes"] == []
@@ -0,0 +1,81 @@
+# server/tests/test_statement_budgets.py
+"""
+Fixed SQL statement counts for the hot read endpoints, through
+metrics.statement_budget. A count that grows with the page size is an
+N+1 (a lazy load per row), so each endpoint is also called with a small
+and a large page and must issue the same statements for both.
+"""
+
+import pytest
+
+import database
+from catalog import bump_catalog
+from metrics import statement_budget
+
+
+def statements(client, *args, **kwargs) -> int:
+    with statement_budget(1000) as stats:
+        response = client.get(*args, **kwargs)
+    assert response.status_code == 200, response.text
+    return stats.statements
+
+
+@pytest.fixture
+def fresh_catalog():
+    # the next catalog read rebuilds its view
+    with database.SessionLocal() as db:
+        bump_catalog(db)
+        db.commit()
+
+
+def test_master_list_build(client, seeded, fresh_catalog):
+    with statement_budget(5):
+        assert client.get("/master/recipies", headers=seeded["cook"]).status_code == 200
+
+
+def test_master_list_cached(client, seeded):
+    client.get("/master/recipies", headers=seeded["cook"])
+    with statement_budget(1):
+        assert client.get("/master/recipies", headers=seeded["cook"]).status_code == 200
+    small = statements(client, "/master/recipies", params={"limit": 2}, headers=seeded["cook"])
+    large = statements(client, "/master/recipies", params={"limit": 15}, headers=seeded["cook"])
+    assert small == large
+
+
+def test_master_detail(client, seeded):
+    client.get("/master/recipies", headers=seeded["cook"])
+    with statement_budget(1):
+        assert client.get(f"/recipie/{seeded['master'][0]}", headers=seeded["cook"]).status_code == 200
+
+
+def test_personal_detail(client, seeded):
+    with statement_budget(5):
+        assert client.get(f"/recipie/{seeded['personal'][0]}", headers=seeded["cook"]).status_code == 200
+
+
+def test_personal_list(client, seeded):
+    with statement_budget(5):
+        assert client.get("/recipies", headers=seeded["cook"]).status_code == 200
+    small = statements(client, "/recipies", params={"limit": 2}, headers=seeded["cook"])
+    large = statements(client, "/recipies", params={"limit": 15}, headers=seeded["cook"])
+    assert small == large
+
+
+def test_personal_list_by_equipment(client, seeded):
+    with statement_budget(5):
+        response = client.get("/recipies", params={"equipment": "French Press"}, headers=seeded["cook"])
+    assert response.status_code == 200
+    small = statements(client, "/recipies", params={"equipment": "French Press", "limit": 2}, headers=seeded["cook"])
+    large = statements(client, "/recipies", params={"equipment": "French Press", "limit": 15}, headers=seeded["cook"])
+    assert small == large
+
+
+def test_notes_page(client, seeded):
+    recipe_id = seeded["master"][9]
+    for n in range(5):
+        client.post(f"/recipies/{recipe_id}/notes", json={"note": f"more {n}"}, headers=seeded["cook"])
+    with statement_budget(2):
+        assert client.get(f"/recipies/{recipe_id}/notes", headers=seeded["cook"]).status_code == 200
+    small = statements(client, f"/recipies/{recipe_id}/notes", params={"limit": 1}, headers=seeded["cook"])
+    large = statements(client, f"/recipies/{recipe_id}/notes", params={"limit": 50}, headers=seeded["cook"])
+    assert small == large
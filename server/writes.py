@@ -0,0 +1,208 @@
+# server/writes.py
+
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+import storage
+from storage import CHILDREN
+
+logger = logging.getLogger(__name__)
+
+
+def payload_children(payload) -> Dict[str, Optional[List[str]]]:
+    """
+    Child values from a RecipeCreate/RecipeUpdate/RecipePatch, keyed like
+    CHILDREN. A collection left out of a patch is None (leave it alone).
+    """
+    return {
+        "utensils": None if payload.Utensils is None else [u["Utensil"] for u in payload.Utensils],
+        "ingredients": payload.Ingredients,
+        "instructions": None if payload.Recipie is None else payload.Recipie.split("\n"),
+    }
+
+
+def payload_fields(payload) -> Dict[str, object]:
+    """payload_children plus title and description: every OVERRIDABLE field, None where not sent."""
+    return {"title": payload.Title, "description": payload.Description, **payload_children(payload)}
+
+
+def insert_children(db: Session, recipe_id: int, children: Dict[str, Optional[List[str]]]):
+    """One multi-row INSERT per non-empty collection stored as rows."""
+    for name, model, column in storage.ROW_CHILDREN:
+        values = children.get(name)
+        if values:
+            db.execute(insert(model), [{"recipe_id": recipe_id, column: v} for v in values])
+
+
+def create_recipe(db: Session, payload, user_id: int, is_master: bool) -> int:
+    """Insert a recipe and its children; the caller commits."""
+    children = payload_children(payload)
+    r = models.Recipe(
+        title=payload.Title,
+        description=payload.Description,
+        is_master_recipe=1 if is_master else 0,
+        user_id=user_id,
+        document=storage.document(children) if storage.DOCUMENT else None,
+    )
+    db.add(r)
+    db.flush()
+    insert_children(db, r.id, children)
+    return r.id
+
+
+# --- Personal copies of master recipes ---
+
+def _overlay(parent: models.Recipe, overrides: Dict[str, object], sent: Dict[str, object]) -> Dict[str, object]:
+    """
+    A copy's overrides after `sent` is written to it: a value that differs
+    from the master's is kept, and one equal to it goes back to being
+    inherited, so later edits to the master show through again.
+    """
+    out = dict(overrides)
+    for name in storage.OVERRIDABLE:
+        value = sent.get(name)
+        if value is None:
+            continue
+        if value == storage.resolve(parent, name):
+            out.pop(name, None)
+        else:
+            out[name] = value
+    return out
+
+
+def create_copy(db: Session, master: models.Recipe, payload, user_id: int) -> int:
+    """
+    A personal copy of `master` holding only the fields `payload` changes;
+    the rest is read from the master. `master` should be loaded with
+    storage.loaders(). The caller commits.
+    """
+    overrides = _overlay(master, {}, payload_fields(payload))
+    r = models.Recipe(
+        title=overrides.get("title", master.title),
+        description=overrides.get("description", master.description),
+        is_master_recipe=0,
+        user_id=user_id,
+        parent_id=master.id,
+        overrides=overrides,
+    )
+    db.add(r)
+    db.flush()
+    # Own equipment is indexed for the ?equipment= filter, as for any recipe
+    if overrides.get("utensils"):
+        insert_children(db, r.id, {"utensils": overrides["utensils"]})
+    return r.id
+
+
+def _apply_copy_changes(db: Session, recipe: models.Recipe, payload) -> List[str]:
+    before = {name: storage.resolve(recipe, name) for name in storage.OVERRIDABLE}
+    overrides = _overlay(recipe.parent, recipe.overrides or {}, payload_fields(payload))
+    if overrides != (recipe.overrides or {}):
+        recipe.overrides = overrides  # a new dict, so the JSON column sees the change
+    after = {name: storage.resolve(recipe, name) for name in storage.OVERRIDABLE}
+    changed = [name for name in storage.OVERRIDABLE if after[name] != before[name]]
+
+    if "title" in changed:
+        recipe.title = after["title"]
+    if "description" in changed:
+        recipe.description = after["description"]
+    if "utensils" in changed:
+        sync_children(db, models.RecipeUtensil, "utensil", recipe.id, overrides.get("utensils", []))
+    logger.debug("Recipe %s (copy of %s): changed %s", recipe.id, recipe.parent_id, changed or "nothing")
+    return changed
+
+
+def copy_ids(db: Session, master_id: int) -> List[int]:
+    return list(db.scalars(select(models.Recipe.id).where(models.Recipe.parent_id == master_id)))
+
+
+def materialize(db: Session, copy: models.Recipe):
+    """
+    Turn a personal copy into a standalone recipe holding its full
+    content: its resolved lists written out as rows (or its document),
+    with no master and no overrides. The caller commits.
+    """
+    fields = {name: storage.resolve(copy, name) for name in storage.OVERRIDABLE}
+    copy.title, copy.description = fields["title"], fields["description"]
+    copy.parent, copy.parent_id, copy.overrides = None, None, None
+    copy.document = storage.document(fields) if storage.DOCUMENT else None
+    for name, model, column in storage.ROW_CHILDREN:
+        sync_children(db, model, column, copy.id, fields[name])
+
+
+def detach_copies(db: Session, master: models.Recipe) -> int:
+    """
+    Materialize every personal copy of `master`, ahead of the master being
+    deleted. The caller commits.
+    """
+    copies = db.scalars(
+        select(models.Recipe).where(models.Recipe.parent_id == master.id).options(*storage.loaders())
+    ).all()
+    for copy in copies:
+        materialize(db, copy)
+    return len(copies)
+
+
+def sync_children(db: Session, model, column: str, recipe_id: int, values: List[str]) -> bool:
+    """
+    Make a recipe's `model` rows equal `values`, position by position:
+    changed rows are updated in place, extra values inserted and surplus
+    rows deleted. Unchanged rows are not written. True if anything changed.
+    """
+    value = getattr(model, column)
+    stored = db.execute(
+        select(model.id, value).where(model.recipe_id == recipe_id).order_by(model.id)
+    ).all()
+
+    updates = [{"id": row_id, column: new} for (row_id, old), new in zip(stored, values) if old != new]
+    extra = values[len(stored):]
+    surplus = [row_id for row_id, _ in stored[len(values):]]
+
+    if updates:
+        db.execute(update(model), updates)
+    if extra:
+        db.execute(insert(model), [{"recipe_id": recipe_id, column: v} for v in extra])
+    if surplus:
+        db.execute(
+            delete(model).where(model.id.in_(surplus)),
+            execution_options={"synchronize_session": False},
+        )
+    return bool(updates or extra or surplus)
+
+
+def apply_changes(db: Session, recipe: models.Recipe, payload) -> List[str]:
+    """
+    Diff `payload` against the stored recipe and write only what differs.
+    Fields that are None are left as they are. Returns the names of the
+    parts that changed; the caller commits.
+    """
+    if recipe.parent_id is not None:
+        return _apply_copy_changes(db, recipe, payload)
+    changed = []
+    if payload.Title is not None and payload.Title != recipe.title:
+        recipe.title = payload.Title
+        changed.append("title")
+    if payload.Description is not None and payload.Description != (recipe.description or ""):
+        recipe.description = payload.Description
+        changed.append("description")
+
+    children = payload_children(payload)
+    if storage.DOCUMENT:
+        stored = storage.document(recipe.document or {})
+        edited = [name for name, _, _ in CHILDREN if children[name] is not None and children[name] != stored[name]]
+        if edited:
+            # a new dict, so the JSON column sees the change
+            recipe.document = dict(stored, **{name: children[name] for name in edited})
+        changed += edited
+        # The document is the reference: only the lists it says changed need their rows synced
+        children = {name: children[name] if name in edited else None for name in children}
+    for name, model, column in storage.ROW_CHILDREN:
+        values = children[name]
+        if values is not None and sync_children(db, model, column, recipe.id, values) and name not in changed:
+            changed.append(name)
+
+    logger.debug("Recipe %s: changed %s", recipe.id, changed or "nothing")
+    return changed